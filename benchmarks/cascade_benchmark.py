@@ -0,0 +1,244 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import argparse
+import concurrent.futures
+import json
+import logging
+import time
+from datetime import datetime
+from pathlib import Path
+from benchmarks.prompt_benchmark import (
+    basic_prompt,
+    detailed_prompt,
+    minimal_prompt,
+    structured_prompt,
+    system_prompt,
+)
+from cache import get_cache
+from cascade import cascade, cost, load_prices, token_cost
+from metrics import LatencyHistogram
+from snapshot import load_tasks
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+log = logging.getLogger(__name__)
+
+PROMPTS = {
+    "original": system_prompt,
+    "basic": basic_prompt,
+    "detailed": detailed_prompt,
+    "minimal": minimal_prompt,
+    "structured": structured_prompt,
+}
+
+# Cheapest and fastest first, escalating to stronger models and prompts
+DEFAULT_CHAIN = [
+    {"model": "ibm-granite/granite-4.0-h-micro", "prompt": "minimal"},
+    {"model": "openai/gpt-oss-20b", "prompt": "original"},
+    {"model": "x-ai/grok-code-fast-1", "prompt": "detailed"},
+]
+
+
+def build_chain(steps):
+    return [
+        {
+            "name": f"{step['model']}:{step['prompt']}",
+            "model": step["model"],
+            "system_prompt": PROMPTS[step["prompt"]],
+        }
+        for step in steps
+    ]
+
+
+class CascadeBenchmark:
+    def __init__(self, chain, workers=1, invoke_options=None, prices=None):
+        self.chain = chain
+        self.workers = workers
+        self.invoke_options = invoke_options or {}
+        self.prices = prices
+        self.dataset = load_tasks("mikeoxmaul/opengamma-prs-dedup")
+        self.results_dir = Path("results/cascade_benchmark")
+        self.results_dir.mkdir(parents=True, exist_ok=True)
+
+    def run_task(self, task, i):
+        try:
+            result, token_stats, info = cascade(
+                self.chain, task["text"], i, **self.invoke_options
+            )
+            return {
+                "success": result == 1,
+                "tokens": token_stats,
+                "info": info,
+                "index": i,
+            }
+        except Exception as e:
+            return {
+                "success": False,
+                "tokens": {
+                    "prompt_tokens": 0,
+                    "completion_tokens": 0,
+                    "total_tokens": 0,
+                },
+                "info": {},
+                "index": i,
+                "error": str(e),
+            }
+
+    def run(self, num_tasks=100):
+        tasks = self.dataset.select(range(min(num_tasks, len(self.dataset))))
+        results = {
+            "chain": [step["name"] for step in self.chain],
+            "success_count": 0,
+            "total_tasks": 0,
+            "resolved_by_step": {step["name"]: 0 for step in self.chain},
+            "escalations": 0,
+            "token_usage": {
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "total_tokens": 0,
+            },
+            "costs": [],
+            "error_types": {},
+            "errors": [],
+        }
+        latency = LatencyHistogram()
+
+        wall_start = time.time()
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.workers
+        ) as executor:
+            futures = [
+                executor.submit(self.run_task, task, i) for i, task in enumerate(tasks)
+            ]
+            for future in concurrent.futures.as_completed(futures):
+                res = future.result()
+                results["total_tasks"] += 1
+                for key in results["token_usage"]:
+                    results["token_usage"][key] += res["tokens"][key]
+                steps = res["info"].get("steps", [])
+                if len(steps) > 1:
+                    results["escalations"] += 1
+                if res["info"].get("latency") is not None:
+                    latency.add(res["info"]["latency"])
+                if self.prices is not None:
+                    results["costs"].append(cost(steps, self.prices))
+                else:
+                    results["costs"].append(token_cost(steps))
+                if res["success"]:
+                    results["success_count"] += 1
+                    results["resolved_by_step"][steps[-1]["name"]] += 1
+                    log.info(f"Task {res['index'] + 1} solved by {steps[-1]['name']}")
+                else:
+                    error_type = res["info"].get("error_type")
+                    if error_type:
+                        results["error_types"][error_type] = (
+                            results["error_types"].get(error_type, 0) + 1
+                        )
+                    log.info(f"Task {res['index'] + 1} failed")
+                if "error" in res:
+                    results["errors"].append(res["error"])
+                    log.error(f"Exception in task: {res['error']}")
+        results["wall_time"] = time.time() - wall_start
+
+        total = results["total_tasks"]
+        if total > 0:
+            results["success_rate"] = results["success_count"] / total
+            results["mean_tokens"] = results["token_usage"]["total_tokens"] / total
+        costs = results.pop("costs")
+        if costs and None not in costs:
+            key = "mean_cost" if self.prices is not None else "mean_token_cost"
+            results[key] = sum(costs) / len(costs)
+        results["latency"] = latency.summary()
+        log.info(
+            f"Cascade SR={results.get('success_rate', 0):.1%}, "
+            f"mean tokens {results.get('mean_tokens', 0):.0f}, "
+            f"p50 latency {results['latency'].get('p50', 0):.2f}s"
+        )
+        return results
+
+    # Сохраняем результат в json в директорию results
+    def save_results(self, results, filename=None):
+        if filename is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"cascade_benchmark_results_{timestamp}.json"
+
+        filepath = self.results_dir / filename
+        with open(filepath, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+        log.info(f"Results are saved in : {filepath}")
+        return filepath
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Number of tasks run concurrently"
+    )
+    parser.add_argument("--num-tasks", type=int, default=100)
+    parser.add_argument(
+        "--chain",
+        help='JSON file with the steps, e.g. [{"model": "openai/gpt-oss-20b", "prompt": "original"}]; '
+        f"prompts: {', '.join(PROMPTS)}",
+    )
+    parser.add_argument(
+        "--prices",
+        help='JSON file with USD per million tokens, {"model": {"prompt": 0.1, "completion": 0.4}}',
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream completions and abort the ones that are not code",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="Bypass the generation cache"
+    )
+    parser.add_argument(
+        "--refresh-cache",
+        action="store_true",
+        help="Regenerate every task and overwrite cached generations",
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        help="Latency budget of every task in seconds, shared by the steps of its cascade",
+    )
+    parser.add_argument(
+        "--in-memory",
+        action="store_true",
+        help="Run scripts from memory and keep presentations as bytes, without workspaces",
+    )
+    args = parser.parse_args()
+    invoke_options = {
+        "stream": args.stream,
+        "use_cache": not args.no_cache,
+        "refresh_cache": args.refresh_cache,
+        "deadline": args.deadline,
+        "in_memory": args.in_memory,
+    }
+
+    steps = DEFAULT_CHAIN
+    if args.chain:
+        with open(args.chain) as f:
+            steps = json.load(f)
+    prices = load_prices(args.prices) if args.prices else None
+
+    benchmark = CascadeBenchmark(
+        build_chain(steps),
+        workers=args.workers,
+        invoke_options=invoke_options,
+        prices=prices,
+    )
+
+    log.info("Starting cascade benchmark")
+    results = benchmark.run(num_tasks=args.num_tasks)
+
+    benchmark.save_results(results)
+    log.info(f"Generation cache: {get_cache().stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,15 +2,17 @@ import os
 import sys
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from datasets import load_dataset
 from datetime import datetime
+import argparse
 import json
 import logging
 import concurrent.futures
 from datetime import datetime
 from pathlib import Path
-from datasets import load_dataset
+from cache import get_cache
+from metrics import record_task, summarize
 from model import invoke_func
+from snapshot import load_tasks
 from pathlib import Path
 import time
 
@@ -90,9 +92,11 @@ prs.save('test.pptx')"""
 
 
 class ModelBenchmark:
-    def __init__(self, system_prompt=None):
+    def __init__(self, system_prompt=None, workers=1, invoke_options=None):
         self.system_prompt = system_prompt or self.get_default_prompt()
-        self.dataset = load_dataset("mikeoxmaul/opengamma-prs", streaming=True)
+        self.workers = workers
+        self.invoke_options = invoke_options or {}
+        self.dataset = load_tasks("mikeoxmaul/opengamma-prs")
         self.results_dir = Path("results/model_benchmark")
         self.results_dir.mkdir(parents=True, exist_ok=True)
         self.task_id = 0
@@ -101,17 +105,17 @@ class ModelBenchmark:
         return system_prompt
 
     def run_task(self, model_name, task, i):
-        id = 1
         try:
             start_time = time.time()
-            result, token_stats = invoke_func(
-                model_name, self.system_prompt, task["text"], id
+            result, token_stats, info = invoke_func(
+                model_name, self.system_prompt, task["text"], i, **self.invoke_options
             )
             execution_time = time.time() - start_time
             return {
                 "success": result == 1,
                 "time": execution_time,
                 "tokens": token_stats,
+                "info": info,
             }
         except Exception as e:
             return {
@@ -122,12 +126,15 @@ class ModelBenchmark:
                     "completion_tokens": 0,
                     "total_tokens": 0,
                 },
+                "info": {},
                 "error": str(e),
             }
 
     # Непосредственно бенчмарк
     def benchmark_models(self, models, num_tasks):
         results = {}
+        # The same tasks for every model, read once from the local snapshot
+        tasks = self.dataset.select(range(min(num_tasks, len(self.dataset))))
 
         for model_name in models:
             log.info(f"Testing model: {model_name}")
@@ -142,32 +149,30 @@ class ModelBenchmark:
                     "total_tokens": 0,
                 },
                 "errors": [],
+                "ttfts": [],
+                "timings": [],
+                "aborted_count": 0,
+                "wasted_tokens": 0,
+                "error_types": {},
+                "timeout_stages": {},
             }
 
-            tasks = list(self.dataset["train"].take(num_tasks))
-
-            with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            wall_start = time.time()
+            with concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.workers
+            ) as executor:
                 futures = [
                     executor.submit(self.run_task, model_name, task, i)
                     for i, task in enumerate(tasks)
                 ]
                 for future in concurrent.futures.as_completed(futures):
                     res = future.result()
-                    model_results["total_tasks"] += 1
-                    model_results["total_time"] += res["time"]
-                    model_results["token_usage"]["prompt_tokens"] += res["tokens"][
-                        "prompt_tokens"
-                    ]
-                    model_results["token_usage"]["completion_tokens"] += res["tokens"][
-                        "completion_tokens"
-                    ]
-                    model_results["token_usage"]["total_tokens"] += res["tokens"][
-                        "total_tokens"
-                    ]
+                    record_task(model_results, res)
                     if res["success"]:
                         model_results["success_count"] += 1
                     if "error" in res:
                         model_results["errors"].append(res["error"])
+            model_results["wall_time"] = time.time() - wall_start
 
             if model_results["total_tasks"] > 0:
                 model_results["success_rate"] = (
@@ -176,6 +181,10 @@ class ModelBenchmark:
                 model_results["avg_time"] = (
                     model_results["total_time"] / model_results["total_tasks"]
                 )
+            if model_results["ttfts"]:
+                model_results["avg_ttft"] = sum(model_results["ttfts"]) / len(
+                    model_results["ttfts"]
+                )
 
             results[model_name] = model_results
             log.info(
@@ -201,6 +210,13 @@ class ModelBenchmark:
                 "total_tasks": data["total_tasks"],
                 "avg_time": data.get("avg_time", 0),
                 "total_time": data["total_time"],
+                "wall_time": data.get("wall_time", 0),
+                "avg_ttft": data.get("avg_ttft"),
+                "latency": summarize(data["timings"]),
+                "aborted_count": data["aborted_count"],
+                "wasted_tokens": data["wasted_tokens"],
+                "error_types": data["error_types"],
+                "timeout_stages": data["timeout_stages"],
                 "token_usage": data["token_usage"],
                 "errors": data["errors"],
             }
@@ -213,18 +229,68 @@ class ModelBenchmark:
 
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Number of tasks run concurrently"
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream completions and abort the ones that are not code",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="Bypass the generation cache"
+    )
+    parser.add_argument(
+        "--refresh-cache",
+        action="store_true",
+        help="Regenerate every task and overwrite cached generations",
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        help="Latency budget of one task in seconds, split across its stages",
+    )
+    parser.add_argument(
+        "--in-memory",
+        action="store_true",
+        help="Run scripts from memory and keep presentations as bytes, without workspaces",
+    )
+    parser.add_argument(
+        "--output-mode",
+        choices=["code", "spec"],
+        default="code",
+        help="Generate python-pptx code or a JSON slide spec rendered in-process",
+    )
+    parser.add_argument(
+        "--candidates",
+        type=int,
+        help="Race this many generations per task and keep the first that works",
+    )
+    args = parser.parse_args()
+    invoke_options = {
+        "stream": args.stream,
+        "use_cache": not args.no_cache,
+        "refresh_cache": args.refresh_cache,
+        "deadline": args.deadline,
+        "in_memory": args.in_memory,
+        "output_mode": args.output_mode,
+        "candidates": args.candidates,
+    }
+
     models_to_test = [
         "openai/gpt-oss-20b",  # Current
         "x-ai/grok-code-fast-1",  # #1 in Programming on openrouter
         "ibm-granite/granite-4.0-h-micro",  # Cheaper and newer than gpt-oss-20b
     ]
 
-    benchmark = ModelBenchmark()
+    benchmark = ModelBenchmark(workers=args.workers, invoke_options=invoke_options)
 
     log.info("Starting benchmark")
     num_tasks = 10
     results = benchmark.benchmark_models(models_to_test, num_tasks)
     benchmark.save_results(results)
+    log.info(f"Generation cache: {get_cache().stats()}")
 
 
 if __name__ == "__main__":
@@ -2,14 +2,18 @@ import os
 import sys
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import argparse
 import time
 import json
 import logging
 import concurrent.futures
 from datetime import datetime
 from pathlib import Path
-from datasets import load_dataset
+from cache import get_cache
+from metrics import record_task, summarize
 from model import invoke_func
+from slide_spec import SYSTEM_PROMPT as SPEC_SYSTEM_PROMPT
+from snapshot import load_tasks
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
@@ -159,9 +163,11 @@ prs.save('test.pptx')"""
 
 
 class PromptBenchmark:
-    def __init__(self, model):
+    def __init__(self, model, workers=1, invoke_options=None):
         self.model = model
-        self.dataset = load_dataset("mikeoxmaul/opengamma-prs-dedup", streaming=True)
+        self.workers = workers
+        self.invoke_options = invoke_options or {}
+        self.dataset = load_tasks("mikeoxmaul/opengamma-prs-dedup")
         self.results_dir = Path("results/prompt_benchmark")
         self.results_dir.mkdir(parents=True, exist_ok=True)
 
@@ -174,18 +180,23 @@ class PromptBenchmark:
             "structured_prompt": structured_prompt,
         }
 
-    def run_task(self, prompt_content, task, i):
-        id = 1
+    def run_task(self, prompt_content, task, i, output_mode="code"):
         try:
             start_time = time.time()
-            result, token_stats = invoke_func(
-                self.model, prompt_content, task["text"], id
+            result, token_stats, info = invoke_func(
+                self.model,
+                prompt_content,
+                task["text"],
+                i,
+                output_mode=output_mode,
+                **self.invoke_options,
             )
             execution_time = time.time() - start_time
             return {
                 "success": result == 1,
                 "time": execution_time,
                 "tokens": token_stats,
+                "info": info,
                 "index": i,
             }
         except Exception as e:
@@ -197,14 +208,22 @@ class PromptBenchmark:
                     "completion_tokens": 0,
                     "total_tokens": 0,
                 },
+                "info": {},
                 "error": str(e),
             }
 
     # Непосредственно бенчмарк
-    def benchmark_prompts(self, prompts, num_tasks=10):
+    def benchmark_prompts(self, prompts, num_tasks=10, spec=False):
         results = {}
-
-        for prompt_name, prompt_content in prompts.items():
+        # The same tasks for every prompt, read once from the local snapshot
+        tasks = self.dataset.select(range(min(num_tasks, len(self.dataset))))
+        # The spec variant replaces the prompt with the slide spec one, so it
+        # runs once rather than with every prompt
+        variants = [(name, content, "code") for name, content in prompts.items()]
+        if spec:
+            variants.append(("spec", SPEC_SYSTEM_PROMPT, "spec"))
+
+        for prompt_name, prompt_content, output_mode in variants:
             log.info(f"Testing prompt: {prompt_name}")
 
             prompt_results = {
@@ -217,30 +236,27 @@ class PromptBenchmark:
                     "total_tokens": 0,
                 },
                 "errors": [],
+                "ttfts": [],
+                "timings": [],
+                "aborted_count": 0,
+                "wasted_tokens": 0,
+                "error_types": {},
+                "timeout_stages": {},
                 "prompt_length": len(prompt_content),
                 "successful_indices": [],
             }
 
-            tasks = list(self.dataset["train"].take(num_tasks))
-
-            with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            wall_start = time.time()
+            with concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.workers
+            ) as executor:
                 futures = [
-                    executor.submit(self.run_task, prompt_content, task, i)
+                    executor.submit(self.run_task, prompt_content, task, i, output_mode)
                     for i, task in enumerate(tasks)
                 ]
                 for future in concurrent.futures.as_completed(futures):
                     res = future.result()
-                    prompt_results["total_tasks"] += 1
-                    prompt_results["total_time"] += res["time"]
-                    prompt_results["token_usage"]["prompt_tokens"] += res["tokens"][
-                        "prompt_tokens"
-                    ]
-                    prompt_results["token_usage"]["completion_tokens"] += res["tokens"][
-                        "completion_tokens"
-                    ]
-                    prompt_results["token_usage"]["total_tokens"] += res["tokens"][
-                        "total_tokens"
-                    ]
+                    record_task(prompt_results, res)
 
                     log.info(f"Task {res["index"] + 1}/{num_tasks} complete")
                     if res["success"]:
@@ -253,6 +269,7 @@ class PromptBenchmark:
                     if "error" in res:
                         prompt_results["errors"].append(res["error"])
                         log.error(f"Exception in task: {res['error']}")
+            prompt_results["wall_time"] = time.time() - wall_start
 
             if prompt_results["total_tasks"] > 0:
                 prompt_results["success_rate"] = (
@@ -261,6 +278,10 @@ class PromptBenchmark:
                 prompt_results["avg_time"] = (
                     prompt_results["total_time"] / prompt_results["total_tasks"]
                 )
+            if prompt_results["ttfts"]:
+                prompt_results["avg_ttft"] = sum(prompt_results["ttfts"]) / len(
+                    prompt_results["ttfts"]
+                )
 
             results[prompt_name] = prompt_results
             log.info(
@@ -285,6 +306,13 @@ class PromptBenchmark:
                 "total_tasks": data["total_tasks"],
                 "avg_time": data.get("avg_time", 0),
                 "total_time": data["total_time"],
+                "wall_time": data.get("wall_time", 0),
+                "avg_ttft": data.get("avg_ttft"),
+                "latency": summarize(data["timings"]),
+                "aborted_count": data["aborted_count"],
+                "wasted_tokens": data["wasted_tokens"],
+                "error_types": data["error_types"],
+                "timeout_stages": data["timeout_stages"],
                 "token_usage": data["token_usage"],
                 "prompt_length": data["prompt_length"],
                 "errors": data["errors"],
@@ -299,17 +327,67 @@ class PromptBenchmark:
 
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Number of tasks run concurrently"
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream completions and abort the ones that are not code",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="Bypass the generation cache"
+    )
+    parser.add_argument(
+        "--refresh-cache",
+        action="store_true",
+        help="Regenerate every task and overwrite cached generations",
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        help="Latency budget of one task in seconds, split across its stages",
+    )
+    parser.add_argument(
+        "--in-memory",
+        action="store_true",
+        help="Run scripts from memory and keep presentations as bytes, without workspaces",
+    )
+    parser.add_argument(
+        "--spec",
+        action="store_true",
+        help='Also test a "spec" variant that generates JSON slide specs rendered in-process',
+    )
+    parser.add_argument(
+        "--candidates",
+        type=int,
+        help="Race this many generations per task and keep the first that works",
+    )
+    args = parser.parse_args()
+    invoke_options = {
+        "stream": args.stream,
+        "use_cache": not args.no_cache,
+        "refresh_cache": args.refresh_cache,
+        "deadline": args.deadline,
+        "in_memory": args.in_memory,
+        "candidates": args.candidates,
+    }
+
     # Используем лучшую модель из предыдущего бенчмарка
     model = "ibm-granite/granite-4.0-h-micro"
 
-    benchmark = PromptBenchmark(model)
+    benchmark = PromptBenchmark(
+        model, workers=args.workers, invoke_options=invoke_options
+    )
 
     prompts = benchmark.get_prompts_to_test()
 
     log.info("Starting prompt benchmark")
-    results = benchmark.benchmark_prompts(prompts, num_tasks=100)
+    results = benchmark.benchmark_prompts(prompts, num_tasks=100, spec=args.spec)
 
     benchmark.save_results(results)
+    log.info(f"Generation cache: {get_cache().stats()}")
 
 
 if __name__ == "__main__":
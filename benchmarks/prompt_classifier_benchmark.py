@@ -2,19 +2,21 @@ import os
 import sys
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import argparse
 import json
-import numpy as np
 import logging
 import concurrent.futures
 import time
 from datetime import datetime
 from pathlib import Path
-from functools import cache
-import requests
 from dotenv import load_dotenv
-from sklearn.linear_model import LogisticRegression
-from datasets import load_dataset
+from cache import get_cache
+from embeddings import get_embeddings
+from metrics import record_task, summarize
 from model import invoke_func
+from router import Router
+from slide_spec import SYSTEM_PROMPT as SPEC_SYSTEM_PROMPT
+from snapshot import load_tasks
 
 load_dotenv()
 
@@ -173,53 +175,36 @@ prompts = {
 }
 
 
-@cache
-def get_embedding(text):
-    key = os.getenv("OPENROUTER_KEY")
-    response = requests.post(
-        "https://openrouter.ai/api/v1/embeddings",
-        headers={
-            "Authorization": f"Bearer {key}",
-            "Content-Type": "application/json",
-        },
-        json={
-            "model": "sentence-transformers/paraphrase-minilm-l6-v2",
-            "input": text,
-        },
-    )
-    data = response.json()
-    embedding = data["data"][0]["embedding"]
-    return embedding
-
-
 class PromptClassifierBenchmark:
-    def __init__(self, model):
+    def __init__(self, model, workers=1, invoke_options=None):
         self.model = model
-        self.dataset = load_dataset("mikeoxmaul/opengamma-prs-dedup", streaming=True)
-        self.tasks = list(self.dataset["train"].skip(100).take(100))
+        self.workers = workers
+        self.invoke_options = invoke_options or {}
+        self.dataset = load_tasks("mikeoxmaul/opengamma-prs-dedup")
+        self.tasks = self.dataset.select(range(100, min(200, len(self.dataset))))
         self.results_dir = Path("results/prompt_classifier")
         self.results_dir.mkdir(parents=True, exist_ok=True)
 
         # Load classifier
-        with open("classifier_tensors.json", "r") as f:
-            data = json.load(f)
-        self.clf = LogisticRegression()
-        self.clf.coef_ = np.array(data["weights"])
-        self.clf.intercept_ = np.array(data["bias"])
-        self.clf.classes_ = np.array([0, 1, 2, 3])
-
-    def run_task(self, prompt_content, task, i):
-        id = 1
+        self.router = Router.load()
+
+    def run_task(self, prompt_content, task, i, output_mode="code"):
         try:
             start_time = time.time()
-            result, token_stats = invoke_func(
-                self.model, prompt_content, task["text"], id
+            result, token_stats, info = invoke_func(
+                self.model,
+                prompt_content,
+                task["text"],
+                i,
+                output_mode=output_mode,
+                **self.invoke_options,
             )
             execution_time = time.time() - start_time
             return {
                 "success": result == 1,
                 "time": execution_time,
                 "tokens": token_stats,
+                "info": info,
                 "index": i,
             }
         except Exception as e:
@@ -231,10 +216,11 @@ class PromptClassifierBenchmark:
                     "completion_tokens": 0,
                     "total_tokens": 0,
                 },
+                "info": {},
                 "error": str(e),
             }
 
-    def benchmark_modes(self):
+    def benchmark_modes(self, spec=False):
         results = {}
 
         # Mode 1: Always use original prompt
@@ -250,9 +236,15 @@ class PromptClassifierBenchmark:
         mode_results = self.run_routed_mode()
         results[mode_name] = mode_results
 
+        # Mode 3: JSON slide specs, which have a prompt of their own
+        if spec:
+            mode_name = "spec"
+            log.info(f"Testing mode: {mode_name}")
+            results[mode_name] = self.run_mode(SPEC_SYSTEM_PROMPT, mode_name, "spec")
+
         return results
 
-    def run_mode(self, prompt_content, mode_name):
+    def run_mode(self, prompt_content, mode_name, output_mode="code"):
         mode_results = {
             "success_count": 0,
             "total_tasks": 0,
@@ -263,27 +255,26 @@ class PromptClassifierBenchmark:
                 "total_tokens": 0,
             },
             "errors": [],
+            "ttfts": [],
+            "timings": [],
+            "aborted_count": 0,
+            "wasted_tokens": 0,
+            "error_types": {},
+            "timeout_stages": {},
             "successful_indices": [],
         }
 
-        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        wall_start = time.time()
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.workers
+        ) as executor:
             futures = [
-                executor.submit(self.run_task, prompt_content, task, i)
+                executor.submit(self.run_task, prompt_content, task, i, output_mode)
                 for i, task in enumerate(self.tasks)
             ]
             for future in concurrent.futures.as_completed(futures):
                 res = future.result()
-                mode_results["total_tasks"] += 1
-                mode_results["total_time"] += res["time"]
-                mode_results["token_usage"]["prompt_tokens"] += res["tokens"][
-                    "prompt_tokens"
-                ]
-                mode_results["token_usage"]["completion_tokens"] += res["tokens"][
-                    "completion_tokens"
-                ]
-                mode_results["token_usage"]["total_tokens"] += res["tokens"][
-                    "total_tokens"
-                ]
+                record_task(mode_results, res)
 
                 log.info(f"Task {res['index'] + 1}/100 complete")
                 if res["success"]:
@@ -296,6 +287,7 @@ class PromptClassifierBenchmark:
                 if "error" in res:
                     mode_results["errors"].append(res["error"])
                     log.error(f"Exception in task: {res['error']}")
+        mode_results["wall_time"] = time.time() - wall_start
 
         if mode_results["total_tasks"] > 0:
             mode_results["success_rate"] = (
@@ -304,6 +296,10 @@ class PromptClassifierBenchmark:
             mode_results["avg_time"] = (
                 mode_results["total_time"] / mode_results["total_tasks"]
             )
+        if mode_results["ttfts"]:
+            mode_results["avg_ttft"] = sum(mode_results["ttfts"]) / len(
+                mode_results["ttfts"]
+            )
 
         log.info(f"Result {mode_name}: SR={mode_results.get('success_rate', 0):.1%}")
 
@@ -320,32 +316,34 @@ class PromptClassifierBenchmark:
                 "total_tokens": 0,
             },
             "errors": [],
+            "ttfts": [],
+            "timings": [],
+            "aborted_count": 0,
+            "wasted_tokens": 0,
+            "error_types": {},
+            "timeout_stages": {},
             "successful_indices": [],
             "routing_counts": {0: 0, 1: 0, 2: 0, 3: 0},
         }
 
-        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        wall_start = time.time()
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.workers
+        ) as executor:
+            # Embed and route the whole task set up front
+            embs = get_embeddings([task["text"] for task in self.tasks])
+            classes, _ = self.router.route(embs)
+
             futures = []
             for i, task in enumerate(self.tasks):
-                emb = get_embedding(task["text"])
-                cls = self.clf.predict([emb])[0]
+                cls = int(classes[i])
                 prompt_content = prompts[cls]
                 mode_results["routing_counts"][cls] += 1
                 futures.append(executor.submit(self.run_task, prompt_content, task, i))
 
             for future in concurrent.futures.as_completed(futures):
                 res = future.result()
-                mode_results["total_tasks"] += 1
-                mode_results["total_time"] += res["time"]
-                mode_results["token_usage"]["prompt_tokens"] += res["tokens"][
-                    "prompt_tokens"
-                ]
-                mode_results["token_usage"]["completion_tokens"] += res["tokens"][
-                    "completion_tokens"
-                ]
-                mode_results["token_usage"]["total_tokens"] += res["tokens"][
-                    "total_tokens"
-                ]
+                record_task(mode_results, res)
 
                 log.info(f"Task {res['index'] + 1}/100 complete")
                 if res["success"]:
@@ -358,6 +356,7 @@ class PromptClassifierBenchmark:
                 if "error" in res:
                     mode_results["errors"].append(res["error"])
                     log.error(f"Exception in task: {res['error']}")
+        mode_results["wall_time"] = time.time() - wall_start
 
         if mode_results["total_tasks"] > 0:
             mode_results["success_rate"] = (
@@ -366,6 +365,10 @@ class PromptClassifierBenchmark:
             mode_results["avg_time"] = (
                 mode_results["total_time"] / mode_results["total_tasks"]
             )
+        if mode_results["ttfts"]:
+            mode_results["avg_ttft"] = sum(mode_results["ttfts"]) / len(
+                mode_results["ttfts"]
+            )
 
         log.info(
             f"Result routed: SR={mode_results.get('success_rate', 0):.1%}, Routing: {mode_results['routing_counts']}"
@@ -388,6 +391,13 @@ class PromptClassifierBenchmark:
                 "total_tasks": data["total_tasks"],
                 "avg_time": data.get("avg_time", 0),
                 "total_time": data["total_time"],
+                "wall_time": data.get("wall_time", 0),
+                "avg_ttft": data.get("avg_ttft"),
+                "latency": summarize(data["timings"]),
+                "aborted_count": data["aborted_count"],
+                "wasted_tokens": data["wasted_tokens"],
+                "error_types": data["error_types"],
+                "timeout_stages": data["timeout_stages"],
                 "token_usage": data["token_usage"],
                 "errors": data["errors"],
                 "successful_indices": data["successful_indices"],
@@ -405,14 +415,64 @@ class PromptClassifierBenchmark:
 
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Number of tasks run concurrently"
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream completions and abort the ones that are not code",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="Bypass the generation cache"
+    )
+    parser.add_argument(
+        "--refresh-cache",
+        action="store_true",
+        help="Regenerate every task and overwrite cached generations",
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        help="Latency budget of one task in seconds, split across its stages",
+    )
+    parser.add_argument(
+        "--in-memory",
+        action="store_true",
+        help="Run scripts from memory and keep presentations as bytes, without workspaces",
+    )
+    parser.add_argument(
+        "--spec",
+        action="store_true",
+        help='Also test a "spec" mode that generates JSON slide specs rendered in-process',
+    )
+    parser.add_argument(
+        "--candidates",
+        type=int,
+        help="Race this many generations per task and keep the first that works",
+    )
+    args = parser.parse_args()
+    invoke_options = {
+        "stream": args.stream,
+        "use_cache": not args.no_cache,
+        "refresh_cache": args.refresh_cache,
+        "deadline": args.deadline,
+        "in_memory": args.in_memory,
+        "candidates": args.candidates,
+    }
+
     model = "ibm-granite/granite-4.0-h-micro"
 
-    benchmark = PromptClassifierBenchmark(model)
+    benchmark = PromptClassifierBenchmark(
+        model, workers=args.workers, invoke_options=invoke_options
+    )
 
     log.info("Starting prompt classifier benchmark")
-    results = benchmark.benchmark_modes()
+    results = benchmark.benchmark_modes(spec=args.spec)
 
     benchmark.save_results(results)
+    log.info(f"Generation cache: {get_cache().stats()}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,163 @@
+import atexit
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+CACHE_PATH = os.getenv("OPENGAMMA_CACHE_PATH", ".cache/generations.sqlite")
+# Least recently used generations are evicted above this size
+CACHE_MAX_BYTES = int(os.getenv("OPENGAMMA_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Access times of hits are written in batches of this many
+TOUCH_BATCH = 64
+
+
+def cache_key(model, system_prompt, task, params=None):
+    """Content address of a generation request."""
+    blob = json.dumps(
+        [model, system_prompt, task, params or {}], sort_keys=True, ensure_ascii=False
+    )
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+class GenerationCache:
+    """On-disk store of completions keyed by cache_key, with LRU eviction.
+
+    Hits only read: their access times are buffered and written with the next
+    put, every TOUCH_BATCH hits or on flush. The total size is kept in memory
+    and only summed up again from the table before evicting, since other
+    processes may share the file.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS generations (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                content TEXT,
+                usage TEXT,
+                size INTEGER,
+                created REAL,
+                accessed REAL
+            )
+            """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS generations_accessed ON generations (accessed)"
+        )
+        self._conn.commit()
+        self._touched = {}
+        self._size = self._total_size()
+
+    def _total_size(self):
+        return self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM generations"
+        ).fetchone()[0]
+
+    def get(self, key):
+        """Returns (content, usage) or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, usage FROM generations WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touched[key] = time.time()
+            if len(self._touched) >= TOUCH_BATCH:
+                self._write_touches()
+                self._conn.commit()
+        content, usage = row
+        return content, json.loads(usage) if usage else None
+
+    def put(self, key, model, content, usage=None):
+        usage = json.dumps(usage) if usage else None
+        size = len(content.encode()) + len(usage or "")
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute(
+                "SELECT size FROM generations WHERE key = ?", (key,)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO generations VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model, content, usage, size, now, now),
+            )
+            self._touched.pop(key, None)
+            self._size += size - (old[0] if old else 0)
+            self._write_touches()
+            if self._size > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def flush(self):
+        """Write the buffered access times of hits."""
+        with self._lock:
+            if self._touched:
+                self._write_touches()
+                self._conn.commit()
+
+    def _write_touches(self):
+        self._conn.executemany(
+            "UPDATE generations SET accessed = ? WHERE key = ?",
+            [(accessed, key) for key, accessed in self._touched.items()],
+        )
+        self._touched.clear()
+
+    def _evict(self):
+        total = self._size = self._total_size()
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute(
+            "SELECT key, size FROM generations ORDER BY accessed"
+        ).fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM generations WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+        self._size = total
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM generations"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "size_bytes": size,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Shared cache, opened on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = GenerationCache()
+            atexit.register(_cache.flush)
+    return _cache
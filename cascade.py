@@ -0,0 +1,124 @@
+import json
+import logging
+import time
+
+from model import Deadline, invoke_func
+
+log = logging.getLogger(__name__)
+
+# Failures worth another step, as long as the cascade's deadline has time left
+ESCALATE_ON = {
+    "aborted",
+    "empty",
+    "api",
+    "invalid_spec",
+    "exception",
+    "no_output",
+    "cpu",
+    "oom",
+    "killed",
+    "timeout",
+}
+# Tail of the failed script's output passed on to the next step
+FEEDBACK_LIMIT = 2000
+# Weight of a completion token against a prompt token in the cost proxy used
+# without prices; output usually costs several times more than input
+COMPLETION_WEIGHT = 4
+
+
+def escalation_task(task, stderr):
+    """Task for the next step of a cascade, with the previous step's error."""
+    if not stderr:
+        return task
+    return (
+        f"{task}\n\n"
+        "A previous script for this presentation failed with the error below. "
+        f"Write a script that avoids it.\n\n{stderr[-FEEDBACK_LIMIT:]}"
+    )
+
+
+def cascade(chain, task, id, escalate_on=ESCALATE_ON, deadline=None, **invoke_options):
+    """Try the (model, prompt) steps of chain in turn, returns (result, token_stats, info).
+
+    chain is a list of {"name", "model", "system_prompt"} dicts, cheapest
+    first. A step that fails with an error in escalate_on hands the task on
+    to the next one, together with the script's stderr. deadline is the
+    latency budget of the whole cascade in seconds: every step gets what is
+    left of it and nothing escalates once it has run out. token_stats sums
+    every step; info is the last step's info plus "steps" (what each step
+    did), "step" (index of the step that succeeded, None if none did) and
+    "latency" (seconds for the whole cascade).
+    """
+    token_stats = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    steps = []
+    result, info = 0, {}
+    stderr = None
+    deadline = Deadline(deadline) if deadline else None
+    start_time = time.time()
+    for i, step in enumerate(chain):
+        step_start = time.time()
+        result, step_tokens, info = invoke_func(
+            step["model"],
+            step["system_prompt"],
+            escalation_task(task, stderr),
+            f"{id}_{i}",
+            deadline=deadline.left() if deadline else None,
+            **invoke_options,
+        )
+        for key in token_stats:
+            token_stats[key] += step_tokens.get(key, 0)
+        steps.append(
+            {
+                "name": step.get("name", step["model"]),
+                "model": step["model"],
+                "error_type": info.get("error_type"),
+                "tokens": step_tokens,
+                "time": time.time() - step_start,
+            }
+        )
+        if result == 1 or info.get("error_type") not in escalate_on:
+            break
+        if deadline and not deadline.left():
+            log.info(f"Step {steps[-1]['name']} failed and the deadline has run out")
+            break
+        log.info(f"Step {steps[-1]['name']} failed ({info['error_type']}), escalating")
+        stderr = info.get("stderr")
+
+    info = dict(info)
+    info["steps"] = steps
+    info["step"] = len(steps) - 1 if result == 1 else None
+    info["latency"] = time.time() - start_time
+    return result, token_stats, info
+
+
+def load_prices(path):
+    """Per-model prices from a JSON file, in USD per million tokens.
+
+    The file maps model ids to {"prompt": ..., "completion": ...}, e.g. the
+    values listed on https://openrouter.ai/models.
+    """
+    with open(path) as f:
+        return json.load(f)
+
+
+def cost(steps, prices):
+    """USD spent on the steps of a cascade, None if a model has no price."""
+    total = 0.0
+    for step in steps:
+        price = prices.get(step["model"])
+        if price is None:
+            return None
+        total += (
+            step["tokens"].get("prompt_tokens", 0) * price["prompt"]
+            + step["tokens"].get("completion_tokens", 0) * price["completion"]
+        ) / 1_000_000
+    return total
+
+
+def token_cost(steps, completion_weight=COMPLETION_WEIGHT):
+    """Price-free cost proxy of the steps of a cascade, in weighted tokens."""
+    return sum(
+        step["tokens"].get("prompt_tokens", 0)
+        + step["tokens"].get("completion_tokens", 0) * completion_weight
+        for step in steps
+    )
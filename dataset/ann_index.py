@@ -0,0 +1,151 @@
+import logging
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+# Индексы для жадной дедубликации: хранят уже оставленные (нормированные) эмбеддинги
+# и для блока запросов возвращают максимальное сходство с ними и id самого похожего
+class ExactIndex:
+    """All kept vectors in one contiguous buffer, searched by brute force."""
+
+    def __init__(self, dim, capacity=1024, dtype=np.float32):
+        self.vectors = np.empty((capacity, dim), dtype=dtype)
+        self.ids = []
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, vector, id):
+        if len(self.ids) == len(self.vectors):
+            grown = np.empty(
+                (2 * len(self.vectors), self.vectors.shape[1]), self.vectors.dtype
+            )
+            grown[: len(self.ids)] = self.vectors
+            self.vectors = grown
+        self.vectors[len(self.ids)] = vector
+        self.ids.append(id)
+
+    def add_many(self, vectors, ids):
+        count = len(self.ids)
+        if count + len(vectors) > len(self.vectors):
+            grown = np.empty(
+                (
+                    max(2 * len(self.vectors), count + len(vectors)),
+                    self.vectors.shape[1],
+                ),
+                self.vectors.dtype,
+            )
+            grown[:count] = self.vectors[:count]
+            self.vectors = grown
+        self.vectors[count : count + len(vectors)] = vectors
+        self.ids.extend(int(id) for id in ids)
+
+    def search(self, queries):
+        """Max similarity of every query to the kept set and the id it belongs to."""
+        best = np.full(len(queries), -np.inf, dtype=queries.dtype)
+        best_ids = np.full(len(queries), -1, dtype=np.int64)
+        if self.ids:
+            sims = queries @ self.vectors[: len(self.ids)].T
+            arg = np.argmax(sims, axis=1)
+            best = sims[np.arange(len(queries)), arg]
+            best_ids = np.asarray(self.ids)[arg]
+        return best, best_ids
+
+    def similarities(self, vector):
+        """Similarity of one vector to every kept vector, in insertion order."""
+        return self.vectors[: len(self.ids)] @ vector
+
+
+class IVFIndex:
+    """Inverted-file index: kept vectors are bucketed by their nearest k-means centroid.
+
+    A query is only compared with the vectors in its nprobe closest buckets,
+    so the cost per query is roughly nprobe / nlist of the exact search.
+    """
+
+    def __init__(self, dim, nlist, nprobe=8, dtype=np.float32):
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = min(nprobe, nlist)
+        self.dtype = dtype
+        self.centroids = None
+        self.vectors = [np.empty((16, dim), dtype=dtype) for _ in range(nlist)]
+        self.ids = [np.empty(16, dtype=np.int64) for _ in range(nlist)]
+        self.counts = np.zeros(nlist, dtype=np.int64)
+
+    def __len__(self):
+        return int(self.counts.sum())
+
+    def train(self, vectors, iterations=10, sample_size=None, seed=0):
+        """Spherical k-means on a sample of (normalized) vectors."""
+        rng = np.random.default_rng(seed)
+        sample_size = sample_size or 32 * self.nlist
+        if len(vectors) > sample_size:
+            vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        centroids = vectors[rng.choice(len(vectors), self.nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(vectors @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, vectors)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # Empty clusters keep their previous centroid
+            filled = norms[:, 0] > 0
+            centroids[filled] = sums[filled] / norms[filled]
+        self.centroids = centroids.astype(self.dtype)
+        log.info(
+            f"==== IVF index trained: {self.nlist} lists on {len(vectors)} vectors"
+        )
+
+    def add(self, vector, id):
+        l = int(np.argmax(self.centroids @ vector))
+        count = self.counts[l]
+        if count == len(self.ids[l]):
+            vectors = np.empty((2 * count, self.dim), dtype=self.dtype)
+            vectors[:count] = self.vectors[l]
+            self.vectors[l] = vectors
+            self.ids[l] = np.concatenate([self.ids[l], np.empty(count, dtype=np.int64)])
+        self.vectors[l][count] = vector
+        self.ids[l][count] = id
+        self.counts[l] += 1
+
+    def add_many(self, vectors, ids, block_size=4096):
+        for start in range(0, len(vectors), block_size):
+            block = np.asarray(vectors[start : start + block_size], dtype=self.dtype)
+            for vector, id in zip(block, ids[start : start + block_size]):
+                self.add(vector, id)
+
+    def _search_lists(self, queries, rows_by_list):
+        best = np.full(len(queries), -np.inf, dtype=queries.dtype)
+        best_ids = np.full(len(queries), -1, dtype=np.int64)
+        for l, rows in rows_by_list:
+            count = self.counts[l]
+            if not count:
+                continue
+            sims = queries[rows] @ self.vectors[l][:count].T
+            arg = np.argmax(sims, axis=1)
+            top = sims[np.arange(len(rows)), arg]
+            better = top > best[rows]
+            best[rows[better]] = top[better]
+            best_ids[rows[better]] = self.ids[l][arg[better]]
+        return best, best_ids
+
+    def search(self, queries):
+        """Approximate max similarity to the kept set, probing nprobe lists per query."""
+        if self.nprobe < self.nlist:
+            closeness = queries @ self.centroids.T
+            probes = np.argpartition(-closeness, self.nprobe - 1, axis=1)
+            probes = probes[:, : self.nprobe]
+        else:
+            probes = np.tile(np.arange(self.nlist), (len(queries), 1))
+        # Group queries by list so each list is searched with one matrix product
+        flat = probes.ravel()
+        order = np.argsort(flat, kind="stable")
+        lists, starts = np.unique(flat[order], return_index=True)
+        rows = np.split(order // self.nprobe, starts[1:])
+        return self._search_lists(queries, zip(lists, rows))
+
+    def search_exact(self, queries):
+        """Brute force over every list, used to measure recall."""
+        everything = np.arange(len(queries))
+        return self._search_lists(queries, ((l, everything) for l in range(self.nlist)))
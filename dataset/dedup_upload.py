@@ -1,30 +1,67 @@
+import argparse
 import json
 from pathlib import Path
-from datasets import load_dataset, Dataset
+
+import numpy as np
+from datasets import load_dataset
+
+from kept_store import read_deltas
 
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--parquet-dir",
+        help="also write the deduplicated split as Parquet shards to this directory",
+    )
+    parser.add_argument(
+        "--rows-per-shard",
+        type=int,
+        default=100_000,
+        help="rows per Parquet shard",
+    )
+    parser.add_argument(
+        "--no-push", action="store_true", help="do not upload to Hugging Face Hub"
+    )
+    args = parser.parse_args()
+
     # Load the deduplication report
     report_path = Path("results/deduplication/deduplication_report.json")
     with open(report_path, "r", encoding="utf-8") as f:
         report = json.load(f)
 
     indices_to_remove = set(report["indices_to_remove"])
+    # Incremental runs append their removals to the delta file instead of the report
+    for delta in read_deltas():
+        indices_to_remove.update(delta["indices_to_remove"])
 
     # Load the original dataset
     dataset = load_dataset("mikeoxmaul/opengamma-prs")
-
-    # Filter the train split to remove duplicates
     train_data = dataset["train"]
-    filtered_data = [
-        item for i, item in enumerate(train_data) if i not in indices_to_remove
-    ]
 
-    # Create a new dataset from the filtered data
-    new_dataset = Dataset.from_list(filtered_data)
+    # Select the rows to keep by index: Arrow only stores an indices mapping,
+    # rows are not copied through Python objects
+    keep_indices = np.setdiff1d(
+        np.arange(len(train_data)),
+        np.fromiter(indices_to_remove, dtype=np.int64, count=len(indices_to_remove)),
+    )
+    new_dataset = train_data.select(keep_indices)
+    print(f"Keeping {len(new_dataset)} of {len(train_data)} rows")
+
+    if args.parquet_dir:
+        parquet_dir = Path(args.parquet_dir)
+        parquet_dir.mkdir(parents=True, exist_ok=True)
+        num_shards = max(1, -(-len(new_dataset) // args.rows_per_shard))
+        for index in range(num_shards):
+            shard = new_dataset.shard(num_shards, index, contiguous=True)
+            shard.to_parquet(
+                parquet_dir / f"train-{index:05d}-of-{num_shards:05d}.parquet"
+            )
+        print(f"Wrote {num_shards} Parquet shards to {parquet_dir}")
 
     # Upload to Hugging Face Hub with the new name
-    new_dataset.push_to_hub("mikeoxmaul/opengamma-prs-dedup")
+    if not args.no_push:
+        new_dataset.push_to_hub("mikeoxmaul/opengamma-prs-dedup")
 
 
 if __name__ == "__main__":
@@ -1,10 +1,14 @@
 from datasets import load_dataset
+import argparse
 import json
 import logging
 import numpy as np
 from pathlib import Path
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
+
+from ann_index import ExactIndex, IVFIndex
+from kept_store import DELTA_PATH, KeptStore, append_delta
+from minhash import lexical_deduplicate
 
 
 logging.basicConfig(
@@ -13,8 +17,84 @@ logging.basicConfig(
 log = logging.getLogger(__name__)
 
 
+def preview(text):
+    return text[:200] + "..." if len(text) > 200 else text
+
+
+class SimilarityHistogram:
+    """Streaming summary of cosine similarities.
+
+    min, max and mean are exact. Percentiles come from a fixed-width histogram
+    over [-1, 1]: every order statistic is placed within one bin width
+    (2 / bins, ~3e-5 by default) of its true value and the two around a rank
+    are interpolated like np.percentile, so the result is within one bin
+    width of np.percentile on the full set of values, however sparse.
+    """
+
+    # Values binned at once, bounds the temporaries of add
+    CHUNK = 1 << 18
+
+    def __init__(self, bins=1 << 16):
+        self.bins = bins
+        self.lo = -1.0
+        self.width = 2.0 / bins
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def add(self, values):
+        values = np.asarray(values).reshape(-1)
+        if not len(values):
+            return
+        self.count += len(values)
+        self.total += float(values.sum(dtype=np.float64))
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        for start in range(0, len(values), self.CHUNK):
+            chunk = values[start : start + self.CHUNK]
+            idx = ((chunk - self.lo) / self.width).astype(np.int64)
+            np.clip(idx, 0, self.bins - 1, out=idx)
+            self.counts += np.bincount(idx, minlength=self.bins)
+
+    def _order_statistic(self, cumulative, k):
+        # k-th smallest value (0-based), spread evenly inside its bin
+        b = int(np.searchsorted(cumulative, k, side="right"))
+        before = cumulative[b - 1] if b else 0
+        value = self.lo + (b + (k - before + 0.5) / self.counts[b]) * self.width
+        return min(max(value, self.min), self.max)
+
+    def percentile(self, q):
+        # Same rank as np.percentile's linear method, interpolated between the
+        # two values around it even when they sit in distant bins
+        rank = q / 100 * (self.count - 1)
+        cumulative = np.cumsum(self.counts)
+        k = int(rank)
+        value = self._order_statistic(cumulative, k)
+        if rank > k:
+            upper = self._order_statistic(cumulative, min(k + 1, self.count - 1))
+            value += (rank - k) * (upper - value)
+        return value
+
+    def stats(self):
+        return {
+            "min": self.min,
+            "max": self.max,
+            "mean": self.total / self.count,
+            "median": self.percentile(50),
+            "percentile_5": self.percentile(5),
+            "percentile_25": self.percentile(25),
+            "percentile_75": self.percentile(75),
+            "percentile_95": self.percentile(95),
+        }
+
+
 class DatasetDeduplicator:
     def __init__(self):
+        # Из extra "torch": остальной модуль (индексы, статистики) работает без него
+        from sentence_transformers import SentenceTransformer
+
         self.dataset = load_dataset("mikeoxmaul/opengamma-prs")
         self.model = SentenceTransformer(
             "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
@@ -29,84 +109,212 @@ class DatasetDeduplicator:
         log.info(f"==== Embeddings calculated: {embeddings.shape}")
         return embeddings
 
-    # Считаем матрицу косинусных расстояний
-    def calculate_similarity_matrix(self, embeddings):
-        log.info("==== Calculating cosine similarity matrix")
-        similarity_matrix = cosine_similarity(embeddings)
-
-        similarities = similarity_matrix[np.triu_indices(len(embeddings), k=1)]
-        log.info(f"==== Similarity matrix calculated: {similarity_matrix.shape}")
-
-        return similarity_matrix, similarities
-
-    # Считаем все нужные статистики
-    def analyze_similarities(self, similarities):
-        import numpy as np
-
-        stats = {
-            "min": np.min(similarities),
-            "max": np.max(similarities),
-            "mean": np.mean(similarities),
-            "median": np.median(similarities),
-            "percentile_5": np.percentile(similarities, 5),
-            "percentile_25": np.percentile(similarities, 25),
-            "percentile_75": np.percentile(similarities, 75),
-            "percentile_95": np.percentile(similarities, 95),
-        }
-
-        return stats
-
-    # Находим дубликаты на основе посчитаных эмбеддингов, дубликатами считаем такие, которые отличаются менне чем на threshold
-    def find_duplicates(self, texts, embeddings, threshold=None):
-        similarity_matrix, similarities = self.calculate_similarity_matrix(embeddings)
-        stats = self.analyze_similarities(similarities)
-        if threshold is None:
-            threshold = stats["percentile_5"]
-        log.info(f"==== Using threshold: {threshold:.3f}")
+    # Считаем статистики косинусных сходств по всем парам текстов. Матрица n×n не
+    # строится: пары считаются блоками строк, значения складываются в
+    # SimilarityHistogram. В max_block_bytes укладывается всё, что живёт во время
+    # блока: сходства с последующими строками (4·r·n байт), квадрат блока с маской
+    # верхнего треугольника и его выборкой (4·r² + r² + 2·r²), итого не больше
+    # 11·r·n; временные массивы add ограничены SimilarityHistogram.CHUNK
+    def analyze_similarities(self, normalized, max_block_bytes=256 * 1024 * 1024):
+        n = len(normalized)
+        block_size = max(1, min(n, max_block_bytes // (11 * max(n, 1))))
+        log.info(
+            f"==== Calculating cosine similarity statistics in blocks of {block_size} rows"
+        )
 
-        keep_indices = [0]
+        histogram = SimilarityHistogram()
+        for start in range(0, n, block_size):
+            end = min(start + block_size, n)
+            block = normalized[start:end]
+            # Pairs inside the block: its upper triangle
+            within = block @ block.T
+            histogram.add(within[np.triu(np.ones(within.shape, dtype=bool), k=1)])
+            del within
+            # Pairs with every later row
+            histogram.add(block @ normalized[end:].T)
+
+        log.info(f"==== Similarity statistics calculated for {histogram.count} pairs")
+        return histogram.stats()
+
+    # Индекс по уже оставленным текстам: "exact" сравнивает с каждым, "ivf" только с
+    # ближайшими кластерами k-means (приближённо, но без квадратичной сложности)
+    def build_index(self, index, training, size, nlist=None, nprobe=8):
+        dim, dtype = training.shape[1], training.dtype
+        if index == "exact":
+            return ExactIndex(dim, dtype=dtype)
+        if index == "ivf":
+            nlist = nlist or max(1, min(len(training), int(np.sqrt(size))))
+            ivf = IVFIndex(dim, nlist, nprobe, dtype=dtype)
+            ivf.train(training)
+            return ivf
+        raise ValueError(f"Unknown index: {index}")
+
+    # Жадный проход по текстам: текст оставляем, если его максимальное сходство с уже
+    # оставленными (в индексе kept) меньше threshold. ids - индексы строк в датасете
+    def search_duplicates(
+        self,
+        texts,
+        normalized,
+        threshold,
+        kept,
+        keep_indices,
+        ids,
+        block_size=1024,
+        recall_sample=0.01,
+        seed=0,
+    ):
+        # Rows are screened in blocks: one index search against the texts kept in
+        # earlier blocks and one matrix product inside the block. With the exact
+        # index, blockwise products can differ from per-row ones in the last float32
+        # bits, so duplicates and rows close to the threshold are checked again with
+        # the same per-row product as before, which keeps the output identical.
+        rng = np.random.default_rng(seed)
+        positions = {id: p for p, id in enumerate(ids)}
+        approximate = not isinstance(kept, ExactIndex)
         duplicate_indices = []
-
-        for i in range(1, len(texts)):
-            if keep_indices:
-                current_embedding = embeddings[i].reshape(1, -1)
-                saved_embeddings = embeddings[keep_indices]
-
-                similarities = cosine_similarity(current_embedding, saved_embeddings)
-                max_similarity = np.max(similarities)
-
-                if max_similarity < threshold:
-                    keep_indices.append(i)
-                else:
-                    most_similar_idx = keep_indices[np.argmax(similarities)]
+        margin = 1e-4
+        sampled = positives = found = 0
+
+        for start in range(0, len(normalized), block_size):
+            block = normalized[start : start + block_size]
+            screen, screen_ids = kept.search(block)
+            if approximate and len(kept):
+                # Recall of the index: of the sampled rows that truly have a kept
+                # neighbour above threshold, how many the index found
+                rows = np.nonzero(rng.random(len(block)) < recall_sample)[0]
+                exact, _ = kept.search_exact(block[rows])
+                sampled += len(rows)
+                positives += int((exact >= threshold).sum())
+                found += int(((exact >= threshold) & (screen[rows] >= threshold)).sum())
+            inner = block @ block.T
+
+            block_kept = []
+            for j in range(len(block)):
+                i = start + j
+                max_similarity = screen[j]
+                most_similar_idx = int(screen_ids[j])
+                if block_kept:
+                    best = int(np.argmax(inner[j, block_kept]))
+                    if inner[j, block_kept[best]] > max_similarity:
+                        max_similarity = inner[j, block_kept[best]]
+                        most_similar_idx = ids[start + block_kept[best]]
+
+                if not approximate and max_similarity >= threshold - margin:
+                    similarities = kept.similarities(normalized[i])
+                    best = np.argmax(similarities)
+                    max_similarity = similarities[best]
+                    most_similar_idx = keep_indices[best]
+
+                if max_similarity >= threshold:
+                    # The original may be a text kept by an earlier run
+                    original = positions.get(most_similar_idx)
                     duplicate_indices.append(
                         {
-                            "duplicate_index": i,
+                            "duplicate_index": ids[i],
                             "original_index": most_similar_idx,
                             "similarity": float(max_similarity),
-                            "duplicate_text": (
-                                texts[i][:200] + "..."
-                                if len(texts[i]) > 200
-                                else texts[i]
-                            ),
+                            "duplicate_text": preview(texts[i]),
                             "original_text": (
-                                texts[most_similar_idx][:200] + "..."
-                                if len(texts[most_similar_idx]) > 200
-                                else texts[most_similar_idx]
+                                preview(texts[original])
+                                if original is not None
+                                else None
                             ),
+                            "stage": "embedding",
                         }
                     )
-            else:
-                keep_indices.append(i)
+                    continue
+
+                kept.add(normalized[i], ids[i])
+                keep_indices.append(ids[i])
+                block_kept.append(j)
+
+        index_report = {"index": "ivf" if approximate else "exact"}
+        if approximate:
+            index_report.update(
+                {
+                    "nlist": kept.nlist,
+                    "nprobe": kept.nprobe,
+                    "sampled_queries": sampled,
+                    "sampled_positives": positives,
+                    "recall": found / positives if positives else None,
+                }
+            )
+            log.info(
+                f"==== Index recall: {found}/{positives} sampled duplicates found by the index"
+            )
+        return duplicate_indices, index_report
+
+    # Находим дубликаты на основе посчитаных эмбеддингов, дубликатами считаем такие, которые отличаются менне чем на threshold
+    def find_duplicates(
+        self,
+        texts,
+        embeddings,
+        threshold=None,
+        block_size=1024,
+        max_block_bytes=256 * 1024 * 1024,
+        index="exact",
+        nlist=None,
+        nprobe=8,
+        recall_sample=0.01,
+        stats_sample=20000,
+        seed=0,
+        ids=None,
+    ):
+        ids = list(range(len(texts))) if ids is None else list(ids)
+        normalized = normalize(embeddings)
+        rng = np.random.default_rng(seed)
+        if index != "exact" and len(normalized) > stats_sample:
+            # All pairs are quadratic too, so the approximate path samples rows for stats
+            sample = np.sort(rng.choice(len(normalized), stats_sample, replace=False))
+            stats = self.analyze_similarities(normalized[sample], max_block_bytes)
+        else:
+            stats = self.analyze_similarities(normalized, max_block_bytes)
+        if threshold is None:
+            threshold = stats["percentile_5"]
+        log.info(f"==== Using threshold: {threshold:.3f}")
+
+        kept = self.build_index(index, normalized, len(normalized), nlist, nprobe)
+        keep_indices = []
+        duplicate_indices, index_report = self.search_duplicates(
+            texts,
+            normalized,
+            threshold,
+            kept,
+            keep_indices,
+            ids,
+            block_size,
+            recall_sample,
+            seed,
+        )
 
         log.info(
             f"==== Duplicate search complete: {len(keep_indices)} to keep, {len(duplicate_indices)} to remove"
         )
-        return keep_indices, duplicate_indices, stats, threshold
+        return keep_indices, duplicate_indices, stats, threshold, index_report
+
+    # Лексический этап до эмбеддингов: точные и почти точные копии отсекаются MinHash.
+    # Возвращает индексы и тексты оставшихся строк и найденные дубликаты
+    def prefilter(self, texts, ids, enabled=True):
+        if not enabled:
+            return list(ids), list(texts), []
+        survivors, duplicates = lexical_deduplicate(texts)
+        for item in duplicates:
+            item["duplicate_text"] = preview(texts[item["duplicate_index"]])
+            item["original_text"] = preview(texts[item["original_index"]])
+            item["duplicate_index"] = ids[item["duplicate_index"]]
+            item["original_index"] = ids[item["original_index"]]
+        return [ids[i] for i in survivors], [texts[i] for i in survivors], duplicates
 
     # Сохраняем результат в json в директорию results
     def save_deduplication_report(
-        self, original_count, final_count, duplicate_indices, stats, threshold
+        self,
+        original_count,
+        final_count,
+        duplicate_indices,
+        stats,
+        threshold,
+        index_report=None,
+        stages=None,
     ):
         duplicate_indices_sorted = sorted(
             duplicate_indices, key=lambda x: x["duplicate_index"]
@@ -121,6 +329,8 @@ class DatasetDeduplicator:
             "reduction_percent": (1 - final_count / original_count) * 100,
             "similarity_threshold": threshold,
             "similarity_statistics": stats,
+            "removed_by_stage": stages,
+            "index": index_report,
             "indices_to_remove": indices_to_remove,
             "duplicate_details": duplicate_indices_sorted,
         }
@@ -137,34 +347,198 @@ class DatasetDeduplicator:
         return report
 
     # Запускаем дедубликацию
-    def run_deduplication(self, threshold=None):
+    def run_deduplication(
+        self, threshold=None, index="exact", nprobe=8, prefilter=True
+    ):
         log.info("==== Starting dataset deduplication")
 
         texts = [item["text"] for item in self.dataset["train"]]
         log.info(f"==== Original dataset size: {len(texts)} tasks")
 
-        embeddings = self.calculate_embeddings(texts)
+        survivor_ids, survivor_texts, lexical_duplicates = self.prefilter(
+            texts, range(len(texts)), prefilter
+        )
+
+        embeddings = self.calculate_embeddings(survivor_texts)
         if embeddings is None:
             return None
 
-        keep_indices, duplicate_indices, stats, used_threshold = self.find_duplicates(
-            texts, embeddings, threshold
+        keep_indices, duplicate_indices, stats, used_threshold, index_report = (
+            self.find_duplicates(
+                survivor_texts,
+                embeddings,
+                threshold,
+                index=index,
+                nprobe=nprobe,
+                ids=survivor_ids,
+            )
         )
+        duplicate_indices = lexical_duplicates + duplicate_indices
 
         report = self.save_deduplication_report(
-            len(texts), len(keep_indices), duplicate_indices, stats, used_threshold
+            len(texts),
+            len(keep_indices),
+            duplicate_indices,
+            stats,
+            used_threshold,
+            index_report,
+            count_stages(duplicate_indices),
         )
 
+        # The kept set seeds later incremental runs; the report covers every row,
+        # so deltas of earlier incremental runs are dropped
+        positions = {id: p for p, id in enumerate(survivor_ids)}
+        store = KeptStore()
+        store.reset()
+        store.append(
+            keep_indices,
+            normalize(embeddings)[[positions[i] for i in keep_indices]],
+            rows_seen=len(texts),
+            threshold=used_threshold,
+        )
+        Path(DELTA_PATH).unlink(missing_ok=True)
+
         log.info(
             f"==== Deduplication completed: {len(keep_indices)}/{len(texts)} tasks recommended to keep"
         )
 
         return report
 
+    # Инкрементальная дедубликация: эмбеддинги считаются только для строк, добавленных
+    # после прошлого запуска, и сравниваются только с сохранённым набором оставленных
+    # текстов. Результат дописывается строкой в delta.jsonl, отчёт не переписывается
+    def run_incremental(
+        self, threshold=None, index="exact", nprobe=8, prefilter=True, seed=0
+    ):
+        store = KeptStore()
+        train = self.dataset["train"]
+        start, end = store.rows_seen, len(train)
+        if start >= end:
+            log.info(f"==== No new rows since the last run ({end} rows processed)")
+            return None
+        log.info(
+            f"==== Incremental deduplication of rows {start}..{end} against {len(store)} kept texts"
+        )
+
+        texts = train.select(range(start, end))["text"]
+        survivor_ids, survivor_texts, lexical_duplicates = self.prefilter(
+            texts, range(start, end), prefilter
+        )
+        if not survivor_ids:
+            # Все новые строки оказались лексическими дубликатами: эмбеддинги
+            # не нужны, продвигаем только границу обработанных строк
+            threshold = threshold or store.threshold
+            store.append([], np.empty((0, 0)), rows_seen=end, threshold=threshold)
+            delta = make_delta(start, end, threshold, None, lexical_duplicates)
+            append_delta(delta)
+            log.info(
+                f"==== Incremental deduplication completed: all {end - start} new tasks are lexical duplicates, delta appended to {DELTA_PATH}"
+            )
+            return delta
+        normalized = normalize(self.calculate_embeddings(survivor_texts))
+
+        threshold = threshold or store.threshold
+        if threshold is None:
+            threshold = self.analyze_similarities(normalized)["percentile_5"]
+        log.info(f"==== Using threshold: {threshold:.3f}")
+
+        kept_ids, kept_embeddings = store.load()
+        training = normalized
+        if kept_embeddings is not None:
+            rng = np.random.default_rng(seed)
+            sample = rng.choice(len(kept_ids), min(len(kept_ids), 50000), replace=False)
+            training = np.vstack([kept_embeddings[np.sort(sample)], normalized])
+        kept = self.build_index(
+            index, training, len(kept_ids) + len(normalized), nprobe=nprobe
+        )
+        if kept_embeddings is not None:
+            kept.add_many(kept_embeddings, kept_ids)
+        keep_indices = [int(id) for id in kept_ids]
+
+        duplicate_indices, index_report = self.search_duplicates(
+            survivor_texts,
+            normalized,
+            threshold,
+            kept,
+            keep_indices,
+            survivor_ids,
+            seed=seed,
+        )
+        duplicate_indices = lexical_duplicates + duplicate_indices
+        new_kept = keep_indices[len(kept_ids) :]
+
+        positions = {id: p for p, id in enumerate(survivor_ids)}
+        store.append(
+            new_kept,
+            normalized[[positions[i] for i in new_kept]],
+            rows_seen=end,
+            threshold=threshold,
+        )
+        delta = make_delta(start, end, threshold, index_report, duplicate_indices)
+        append_delta(delta)
+
+        log.info(
+            f"==== Incremental deduplication completed: {len(new_kept)}/{end - start} new tasks kept, delta appended to {DELTA_PATH}"
+        )
+        return delta
+
+
+def make_delta(start, end, threshold, index_report, duplicates):
+    return {
+        "rows": [start, end],
+        "similarity_threshold": threshold,
+        "index": index_report,
+        "removed_by_stage": count_stages(duplicates),
+        "indices_to_remove": sorted(item["duplicate_index"] for item in duplicates),
+        "duplicate_details": sorted(duplicates, key=lambda x: x["duplicate_index"]),
+    }
+
+
+def count_stages(duplicates):
+    stages = {"exact": 0, "minhash": 0, "embedding": 0}
+    for item in duplicates:
+        stages[item["stage"]] += 1
+    return stages
+
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--index",
+        choices=["exact", "ivf"],
+        default="exact",
+        help="exact compares with every kept text, ivf only with the nearest clusters",
+    )
+    parser.add_argument(
+        "--nprobe",
+        type=int,
+        default=8,
+        help="clusters searched per text with --index ivf",
+    )
+    parser.add_argument(
+        "--no-prefilter",
+        action="store_true",
+        help="skip the MinHash stage and embed every text",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only process rows added since the last run and append a delta",
+    )
+    args = parser.parse_args()
+
     deduplicator = DatasetDeduplicator()
-    deduplicator.run_deduplication(threshold=0.8)
+    run = (
+        deduplicator.run_incremental
+        if args.incremental
+        else deduplicator.run_deduplication
+    )
+    run(
+        threshold=0.8,
+        index=args.index,
+        nprobe=args.nprobe,
+        prefilter=not args.no_prefilter,
+    )
 
 
 if __name__ == "__main__":
@@ -1,33 +1,133 @@
+import argparse
+import json
+import os
 import sqlite3
+from pathlib import Path
 
-conn = sqlite3.connect("sqlite.db")
-cursor = conn.cursor()
+import pyarrow as pa
+import pyarrow.parquet as pq
 
+KEYWORD = "резентаци"
+OUTPUT_DIR = "data"
+STATE_FILE = "extract_state.json"
+CHUNK_ROWS = 1000
+SHARD_ROWS = 50_000
+
+SCHEMA = pa.schema([("text", pa.string())])
+
+# First user and assistant message of every conversation in (after, until],
+# the keyword filter runs inside SQLite so only matches reach Python. A match
+# whose assistant reply has not arrived yet comes back with NULL content
 query = """
-WITH convs AS (SELECT id FROM conversations ORDER BY id),
+WITH convs AS (SELECT id FROM conversations WHERE id > ? AND id <= ? ORDER BY id),
 first_msgs AS (
     SELECT conversation_id, role, content,
            ROW_NUMBER() OVER (PARTITION BY conversation_id, role ORDER BY created_at) as rn
     FROM messages
     WHERE conversation_id IN (SELECT id FROM convs) AND role IN ('user', 'assistant')
+),
+pairs AS (
+    SELECT conversation_id,
+           MAX(CASE WHEN role='user' THEN content END) as user_content,
+           MAX(CASE WHEN role='assistant' THEN content END) as assistant_content
+    FROM first_msgs
+    WHERE rn = 1
+    GROUP BY conversation_id
 )
-SELECT MAX(CASE WHEN role='user' THEN content END) as user_content,
-       MAX(CASE WHEN role='assistant' THEN content END) as assistant_content
-FROM first_msgs
-WHERE rn = 1
-GROUP BY conversation_id
+SELECT conversation_id, assistant_content
+FROM pairs
+WHERE (instr(user_content, ?) > 0 OR instr(assistant_content, ?) > 0)
 ORDER BY conversation_id
 """
 
-cursor.execute(query)
-results = cursor.fetchall()
-
-count = 0
-for row in results:
-    user_content, assistant_content = row
-    if 'резентаци' in user_content or 'резентаци' in assistant_content:
-        count+=1
-        with open('test/task'+str(count).rjust(4, '0')+'.txt', 'w') as f:
-                f.write(assistant_content)
-print(f"Found {count}")
-conn.close()
+
+def load_state(output_dir):
+    path = output_dir / STATE_FILE
+    if not path.exists():
+        return {"last_conversation_id": None, "shards": 0, "rows": 0}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(output_dir, state):
+    path = output_dir / STATE_FILE
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default="sqlite.db")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="ignore the stored watermark and extract every conversation again",
+    )
+    args = parser.parse_args()
+
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    state = load_state(output_dir)
+    if args.full:
+        state = {"last_conversation_id": None, "shards": 0, "rows": 0}
+    # Shards of an interrupted run are not in the state and get written again
+    for shard in output_dir.glob("train-*.parquet"):
+        if int(shard.stem.split("-")[1]) >= state["shards"]:
+            shard.unlink()
+
+    conn = sqlite3.connect(args.db)
+    cursor = conn.cursor()
+
+    # Conversations are extracted up to the newest one that exists now, which
+    # becomes the watermark for the next run unless a match is still waiting
+    (until,) = cursor.execute("SELECT MAX(id) FROM conversations").fetchone()
+    after = state["last_conversation_id"]
+    if until is None or (after is not None and until <= after):
+        print("No new conversations")
+        conn.close()
+        return
+    cursor.execute(query, (after if after is not None else -1, until, KEYWORD, KEYWORD))
+
+    count = 0
+    writer = None
+    shard_rows = 0
+    watermark = until
+    while True:
+        rows = cursor.fetchmany(CHUNK_ROWS)
+        # Extraction stops at the first match still waiting for its reply and
+        # the next run starts again from it
+        waiting = next((i for i, row in enumerate(rows) if row[1] is None), None)
+        if waiting is not None:
+            watermark = rows[waiting][0] - 1
+            rows = rows[:waiting]
+        if not rows:
+            break
+        if writer is None or shard_rows >= SHARD_ROWS:
+            if writer is not None:
+                writer.close()
+            writer = pq.ParquetWriter(
+                output_dir / f"train-{state['shards']:05d}.parquet", SCHEMA
+            )
+            state["shards"] += 1
+            shard_rows = 0
+        writer.write_table(pa.table({"text": [row[1] for row in rows]}, schema=SCHEMA))
+        shard_rows += len(rows)
+        count += len(rows)
+        if waiting is not None:
+            break
+    if writer is not None:
+        writer.close()
+
+    # Written last: an interrupted run is redone from the previous watermark
+    state["last_conversation_id"] = watermark
+    state["rows"] += count
+    save_state(output_dir, state)
+    print(f"Found {count}, {state['rows']} in {output_dir} ({state['shards']} shards)")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+# Binary and large, so kept out of the tracked results/ directory
+STORE_DIR = os.getenv("OPENGAMMA_KEPT_SET_DIR", ".cache/kept_set")
+DELTA_PATH = "results/deduplication/delta.jsonl"
+
+
+class KeptStore:
+    """Kept texts of earlier deduplication runs, persisted between runs.
+
+    embeddings.f32 holds the normalized embeddings of kept rows and ids.i64
+    their dataset indices, both append-only. state.json is written last and
+    records how many rows of each file are valid, how many dataset rows were
+    already processed and the threshold they were processed with.
+    """
+
+    def __init__(self, directory=STORE_DIR):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.embeddings_path = self.directory / "embeddings.f32"
+        self.ids_path = self.directory / "ids.i64"
+        self.state_path = self.directory / "state.json"
+        self.state = {"kept": 0, "rows_seen": 0, "dim": None, "threshold": None}
+        if self.state_path.exists():
+            with open(self.state_path) as f:
+                self.state = json.load(f)
+        # Drop rows appended by a run that stopped before writing its state
+        for path, row_bytes in self._files():
+            if path.exists() and path.stat().st_size > self.state["kept"] * row_bytes:
+                os.truncate(path, self.state["kept"] * row_bytes)
+
+    def _files(self):
+        return [
+            (self.embeddings_path, 4 * (self.state["dim"] or 0)),
+            (self.ids_path, 8),
+        ]
+
+    def __len__(self):
+        return self.state["kept"]
+
+    @property
+    def rows_seen(self):
+        return self.state["rows_seen"]
+
+    @property
+    def threshold(self):
+        return self.state["threshold"]
+
+    def load(self):
+        """Returns (ids, embeddings) of every kept row, embeddings memory-mapped."""
+        if not self.state["kept"]:
+            return np.empty(0, dtype=np.int64), None
+        ids = np.fromfile(self.ids_path, dtype=np.int64, count=self.state["kept"])
+        embeddings = np.memmap(
+            self.embeddings_path,
+            dtype=np.float32,
+            mode="r",
+            shape=(self.state["kept"], self.state["dim"]),
+        )
+        return ids, embeddings
+
+    def append(self, ids, embeddings, rows_seen, threshold):
+        """Add newly kept rows and mark dataset rows up to rows_seen as processed."""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if len(embeddings):
+            if self.state["dim"] is None:
+                self.state["dim"] = embeddings.shape[1]
+            elif embeddings.shape[1] != self.state["dim"]:
+                raise ValueError(
+                    f"Expected {self.state['dim']}-dim embeddings, got {embeddings.shape[1]}"
+                )
+        with open(self.embeddings_path, "ab") as f:
+            f.write(embeddings.tobytes())
+        with open(self.ids_path, "ab") as f:
+            f.write(np.asarray(ids, dtype=np.int64).tobytes())
+        self.state.update(
+            kept=self.state["kept"] + len(ids),
+            rows_seen=rows_seen,
+            threshold=threshold,
+        )
+        self._write_state()
+
+    def reset(self):
+        for path, _ in self._files():
+            path.unlink(missing_ok=True)
+        self.state = {"kept": 0, "rows_seen": 0, "dim": None, "threshold": None}
+        self._write_state()
+
+    def _write_state(self):
+        tmp = self.state_path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.state_path)
+
+
+def append_delta(entry, path=DELTA_PATH):
+    """One line per incremental run: the rows it covered and what they removed."""
+    entry = {"created": time.time(), **entry}
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+
+
+def read_deltas(path=DELTA_PATH):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
@@ -0,0 +1,119 @@
+import hashlib
+import logging
+import re
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+SHINGLE_SIZE = 5
+NUM_PERM = 128
+BANDS = 16
+# Estimated Jaccard similarity of shingle sets from which texts count as near-exact copies
+JACCARD_THRESHOLD = 0.85
+
+_MASK = np.uint64(0xFFFFFFFF)
+
+
+def normalize_text(text):
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def shingle_hashes(text, size=SHINGLE_SIZE):
+    """Distinct 64-bit hashes of the character shingles of a normalized text."""
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    if len(codes) < size:
+        codes = np.pad(codes, (0, size - len(codes)))
+    # Polynomial hash of every window, arithmetic wraps modulo 2**64
+    hashes = np.zeros(len(codes) - size + 1, dtype=np.uint64)
+    base = np.uint64(1000003)
+    for j in range(size):
+        hashes = hashes * base + codes[j : len(codes) - size + 1 + j]
+    return np.unique(hashes)
+
+
+class MinHasher:
+    """MinHash signatures with multiply-shift hashing: h(x) = (a * x + b) >> 32."""
+
+    def __init__(self, num_perm=NUM_PERM, seed=0):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, 1 << 63, num_perm, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64)
+
+    def signature(self, hashes):
+        with np.errstate(over="ignore"):
+            permuted = (
+                self.a[:, None] * hashes[None, :] + self.b[:, None]
+            ) >> np.uint64(32)
+        return (permuted & _MASK).min(axis=1).astype(np.uint32)
+
+
+def lexical_deduplicate(
+    texts,
+    num_perm=NUM_PERM,
+    bands=BANDS,
+    threshold=JACCARD_THRESHOLD,
+    shingle_size=SHINGLE_SIZE,
+):
+    """Greedy lexical dedup, run before any embedding is computed.
+
+    Stage "exact": texts equal after whitespace and case normalization.
+    Stage "minhash": texts whose estimated shingle Jaccard similarity with an
+    earlier kept text is at least threshold. Candidates come from LSH banding:
+    signatures are cut into bands and texts sharing any band are compared.
+    Returns (keep_indices, duplicates) in the same format as find_duplicates.
+    """
+    rows = num_perm // bands
+    hasher = MinHasher(num_perm)
+    seen = {}
+    buckets = [{} for _ in range(bands)]
+    signatures = {}
+    keep_indices = []
+    duplicates = []
+
+    for i, text in enumerate(texts):
+        normalized = normalize_text(text)
+        digest = hashlib.sha1(normalized.encode()).digest()
+        if digest in seen:
+            duplicates.append(
+                {
+                    "duplicate_index": i,
+                    "original_index": seen[digest],
+                    "similarity": 1.0,
+                    "stage": "exact",
+                }
+            )
+            continue
+
+        signature = hasher.signature(shingle_hashes(normalized, shingle_size))
+        keys = [signature[b * rows : (b + 1) * rows].tobytes() for b in range(bands)]
+        candidates = set()
+        for bucket, key in zip(buckets, keys):
+            candidates.update(bucket.get(key, ()))
+
+        best, best_similarity = None, 0.0
+        for j in sorted(candidates):
+            similarity = float(np.mean(signatures[j] == signature))
+            if similarity > best_similarity:
+                best, best_similarity = j, similarity
+        if best is not None and best_similarity >= threshold:
+            duplicates.append(
+                {
+                    "duplicate_index": i,
+                    "original_index": best,
+                    "similarity": best_similarity,
+                    "stage": "minhash",
+                }
+            )
+            continue
+
+        seen[digest] = i
+        signatures[i] = signature
+        for bucket, key in zip(buckets, keys):
+            bucket.setdefault(key, []).append(i)
+        keep_indices.append(i)
+
+    log.info(
+        f"==== Lexical dedup: {len(keep_indices)} to keep, {len(duplicates)} to remove"
+    )
+    return keep_indices, duplicates
@@ -1,14 +1,11 @@
 import glob
 from datasets import Dataset
 
-# Read the text files completely
-texts = []
-for file_path in sorted(glob.glob("test/task*.txt")):
-    with open(file_path, "r") as f:
-        texts.append(f.read())
+# Read the Parquet shards written by extract_dataset.py
+shards = sorted(glob.glob("data/train-*.parquet"))
 
-# Create Hugging Face dataset from the full texts
-dataset = Dataset.from_dict({"text": texts})
+# Create Hugging Face dataset from the shards
+dataset = Dataset.from_parquet(shards)
 
 # Push to Hugging Face Hub (replace 'your-username' and 'dataset-name' with actual values)
 dataset.push_to_hub("mikeoxmaul/opengamma-prs")
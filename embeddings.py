@@ -0,0 +1,260 @@
+import contextlib
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import requests
+from dotenv import load_dotenv
+
+log = logging.getLogger(__name__)
+
+load_dotenv()
+
+EMBEDDINGS_URL = "https://openrouter.ai/api/v1/embeddings"
+EMBEDDING_MODEL = "sentence-transformers/paraphrase-minilm-l6-v2"
+STORE_DIR = os.getenv("OPENGAMMA_EMBEDDING_DIR", ".cache/embeddings")
+
+# Limits for one /embeddings request and how many of them run at once
+BATCH_SIZE = 64
+BATCH_MAX_CHARS = 200_000
+MAX_CONCURRENT_BATCHES = 4
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class EmbeddingStore:
+    """Embeddings of one model kept on disk and read through a memory map.
+
+    Vectors are rows of a float32 matrix file (<model>.f32) whose width is
+    recorded in <model>.json; row i belongs to the text whose hash is on
+    line i of the index file (<model>.index). Both files are append-only and
+    appends hold a lock on <model>.lock, so a store can be shared by every
+    script.
+    """
+
+    def __init__(self, model=EMBEDDING_MODEL, directory=STORE_DIR):
+        self.model = model
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        slug = re.sub(r"[^\w.-]", "_", model)
+        self.matrix_path = directory / f"{slug}.f32"
+        self.index_path = directory / f"{slug}.index"
+        self.meta_path = directory / f"{slug}.json"
+        self.lock_path = directory / f"{slug}.lock"
+        self._lock = threading.Lock()
+        self.rows = {}
+        self.dim = None
+        self._count = 0
+        self._index_size = 0
+        self._matrix = None
+        with self._file_lock():
+            self._refresh()
+            if self.dim is None and self._count:
+                self._adopt_dim()
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        # Serializes appends of every process sharing the store
+        with open(self.lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _refresh(self):
+        """Read index lines appended since the last call, by any process.
+
+        A trailing line without its newline is an append still in progress
+        (or one that crashed) and is left for later.
+        """
+        if self.dim is None and self.meta_path.exists():
+            self.dim = json.loads(self.meta_path.read_text())["dim"]
+        if not self.index_path.exists():
+            return
+        with open(self.index_path, "rb") as f:
+            f.seek(self._index_size)
+            tail = f.read()
+        end = tail.rfind(b"\n") + 1
+        if not end:
+            return
+        for line in tail[:end].decode().splitlines():
+            self.rows.setdefault(line, self._count)
+            self._count += 1
+        self._index_size += end
+        self._matrix = None
+
+    def _adopt_dim(self):
+        # Stores written before the .json file existed: the width is only
+        # known if the matrix holds exactly one vector per index line
+        size = self.matrix_path.stat().st_size if self.matrix_path.exists() else 0
+        if size % (4 * self._count):
+            raise ValueError(
+                f"Cannot tell the vector size of {self.matrix_path}; delete the store to rebuild it"
+            )
+        self.dim = size // (4 * self._count)
+        self._write_meta()
+
+    def _write_meta(self):
+        tmp = self.meta_path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps({"model": self.model, "dim": self.dim}))
+        os.replace(tmp, self.meta_path)
+
+    def _view(self):
+        if self._matrix is None and self._count:
+            self._matrix = np.memmap(
+                self.matrix_path,
+                dtype=np.float32,
+                mode="r",
+                shape=(self._count, self.dim),
+            )
+        return self._matrix
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, text):
+        return text_hash(text) in self.rows
+
+    def get(self, text):
+        """Stored vector for text or None."""
+        key = text_hash(text)
+        with self._lock:
+            if key not in self.rows:
+                self._refresh()
+            row = self.rows.get(key)
+            if row is None:
+                return None
+            return np.array(self._view()[row])
+
+    def get_many(self, texts):
+        """Stored vectors for texts as one matrix; every text must be present."""
+        with self._lock:
+            rows = [self.rows[text_hash(text)] for text in texts]
+            if not rows:
+                return np.empty((0, self.dim or 0), dtype=np.float32)
+            return np.array(self._view()[rows])
+
+    def add(self, text, vector):
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        key = text_hash(text)
+        with self._lock, self._file_lock():
+            # Other processes may have appended since we last looked
+            self._refresh()
+            if key in self.rows:
+                return
+            if self.dim is None:
+                self.dim = len(vector)
+                self._write_meta()
+            elif len(vector) != self.dim:
+                raise ValueError(
+                    f"Expected a {self.dim}-dim vector for {self.model}, got {len(vector)}"
+                )
+            # The vector goes to the row its index line will get, over
+            # anything a crashed append left behind; matrix first, so an
+            # index line never points past the matrix
+            mode = "r+b" if self.matrix_path.exists() else "wb"
+            with open(self.matrix_path, mode) as f:
+                f.seek(self._count * self.dim * 4)
+                f.write(vector.tobytes())
+                f.truncate()
+            line = f"{key}\n".encode()
+            with open(self.index_path, "ab") as f:
+                f.truncate(self._index_size)
+                f.write(line)
+            self.rows[key] = self._count
+            self._count += 1
+            self._index_size += len(line)
+            self._matrix = None
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+_http = requests.Session()
+
+
+def get_store(model=EMBEDDING_MODEL):
+    with _stores_lock:
+        if model not in _stores:
+            _stores[model] = EmbeddingStore(model)
+    return _stores[model]
+
+
+def fetch_embeddings(texts, model=EMBEDDING_MODEL):
+    """One request for a list of texts, vectors come back in input order."""
+    key = os.getenv("OPENROUTER_KEY")
+    response = _http.post(
+        EMBEDDINGS_URL,
+        headers={
+            "Authorization": f"Bearer {key}",
+            "Content-Type": "application/json",
+        },
+        json={
+            "model": model,
+            "input": texts,
+        },
+    )
+    response.raise_for_status()
+    data = sorted(response.json()["data"], key=lambda item: item["index"])
+    return [item["embedding"] for item in data]
+
+
+def make_batches(texts, batch_size=BATCH_SIZE, max_chars=BATCH_MAX_CHARS):
+    """Split texts into batches limited by count and total length."""
+    batches = []
+    batch = []
+    chars = 0
+    for text in texts:
+        if batch and (len(batch) >= batch_size or chars + len(text) > max_chars):
+            batches.append(batch)
+            batch = []
+            chars = 0
+        batch.append(text)
+        chars += len(text)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def get_embeddings(
+    texts,
+    model=EMBEDDING_MODEL,
+    batch_size=BATCH_SIZE,
+    max_workers=MAX_CONCURRENT_BATCHES,
+):
+    """Embeddings of many texts as a (len(texts), dim) matrix.
+
+    Texts already in the store are read from disk; the rest are fetched in
+    batches that run concurrently and are added to the store.
+    """
+    store = get_store(model)
+    missing = list(dict.fromkeys(text for text in texts if text not in store))
+    if missing:
+        batches = make_batches(missing, batch_size)
+        log.info(f"Fetching {len(missing)} embeddings in {len(batches)} requests")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for batch, vectors in zip(
+                batches, executor.map(lambda b: fetch_embeddings(b, model), batches)
+            ):
+                for text, vector in zip(batch, vectors):
+                    store.add(text, vector)
+    return store.get_many(texts)
+
+
+def get_embedding(text, model=EMBEDDING_MODEL):
+    """Embedding of text, fetched over HTTP only the first time it is seen."""
+    store = get_store(model)
+    embedding = store.get(text)
+    if embedding is None:
+        embedding = np.asarray(fetch_embeddings([text], model)[0], dtype=np.float32)
+        store.add(text, embedding)
+    return embedding
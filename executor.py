@@ -0,0 +1,506 @@
+import asyncio
+import contextlib
+import io
+import logging
+import multiprocessing
+import os
+import resource
+import runpy
+import signal
+import site
+import subprocess
+import sys
+import sysconfig
+import threading
+import time
+import traceback
+from multiprocessing import forkserver, spawn
+
+from metrics import timed
+
+log = logging.getLogger(__name__)
+
+# Modules imported once by the fork server and inherited by every job
+PRELOAD = [
+    "pptx",
+    "pptx.util",
+    "pptx.dml.color",
+    "pptx.enum.text",
+    "executor",
+    "metrics",
+    # Importing ctypes loads libraries, which sandboxed jobs may not do;
+    # preloaded, numpy and friends still import
+    "ctypes",
+]
+
+# Sandbox limits of one script; OPENGAMMA_SANDBOX=0 turns them off
+SANDBOX = os.getenv("OPENGAMMA_SANDBOX", "1") != "0"
+SCRIPT_TIMEOUT = float(os.getenv("OPENGAMMA_SCRIPT_TIMEOUT", "60"))
+SCRIPT_CPU_SECONDS = int(os.getenv("OPENGAMMA_SCRIPT_CPU_SECONDS", "30"))
+SCRIPT_MEMORY_BYTES = int(
+    os.getenv("OPENGAMMA_SCRIPT_MEMORY_BYTES", str(1024 * 1024 * 1024))
+)
+
+# How often a waiting run checks whether it was cancelled, in seconds
+CANCEL_POLL = 0.05
+
+# Typed failures of a script run
+TIMEOUT = "timeout"
+CPU = "cpu"
+OOM = "oom"
+EXCEPTION = "exception"
+KILLED = "killed"
+
+# Audit events that would let a script start code outside the sandbox
+_SPAWN_EVENTS = {
+    "os.exec",
+    "os.fork",
+    "os.forkpty",
+    "os.posix_spawn",
+    "os.spawn",
+    "os.system",
+    "subprocess.Popen",
+}
+# Audit events whose first argument is a path the script changes
+_WRITE_EVENTS = {
+    "os.chmod",
+    "os.chown",
+    "os.link",
+    "os.mkdir",
+    "os.remove",
+    "os.rename",
+    "os.rmdir",
+    "os.symlink",
+    "os.truncate",
+    "os.utime",
+    "shutil.rmtree",
+}
+_WRITE_FLAGS = os.O_WRONLY | os.O_RDWR | os.O_CREAT | os.O_APPEND | os.O_TRUNC
+# Device files a script may read; the rest of /dev holds other tasks' workspaces
+_READABLE_DEVICES = ["/dev/null", "/dev/random", "/dev/urandom"]
+# Environment variables a script keeps, the rest (API keys) is cleared
+_ENVIRON_KEEP = ["PATH", "LANG", "LC_ALL", "LC_CTYPE", "TZ"]
+
+
+def _inside(path, roots):
+    path = os.path.realpath(os.fsdecode(path))
+    return any(path == root or path.startswith(root + os.sep) for root in roots)
+
+
+def _library_dirs():
+    # The standard library and site-packages, but not the project directory
+    # or anything else on sys.path
+    paths = sysconfig.get_paths()
+    dirs = [paths[name] for name in ("stdlib", "platstdlib", "purelib", "platlib")]
+    dirs += site.getsitepackages()
+    if site.ENABLE_USER_SITE:
+        dirs.append(site.getusersitepackages())
+    return {os.path.realpath(path) for path in dirs if os.path.isdir(path)}
+
+
+def _restrict_filesystem(workdir):
+    """Audit hook: writes only inside workdir, reads only there and in the libraries.
+
+    Without a workdir the script cannot write anywhere. Audit hooks are a
+    best-effort guard against mistakes of generated code, not a security
+    boundary: code in extension modules is not audited.
+    """
+    writable = [os.path.realpath(workdir)] if workdir else []
+    readable = {*writable, *_READABLE_DEVICES, *_library_dirs()}
+
+    def hook(event, args):
+        # ctypes can call libc (system, fork) and read any memory
+        if event in _SPAWN_EVENTS or event.startswith("ctypes."):
+            raise PermissionError(f"sandbox: {event} is not allowed")
+        if event == "open":
+            path, mode, flags = args
+            if isinstance(path, int) or path is None:
+                return
+            writing = bool(set(mode or "") & set("wax+")) or bool(
+                (flags or 0) & _WRITE_FLAGS
+            )
+            if not _inside(path, writable if writing else readable):
+                raise PermissionError(
+                    f"sandbox: {'writing' if writing else 'reading'} {path} is not allowed"
+                )
+        elif event in ("os.listdir", "os.scandir"):
+            path = args[0]
+            if isinstance(path, (str, bytes, os.PathLike)) and not _inside(
+                path, readable
+            ):
+                raise PermissionError(f"sandbox: listing {path} is not allowed")
+        elif event in _WRITE_EVENTS:
+            paths = (
+                args[:2]
+                if event in ("os.rename", "os.link", "os.symlink")
+                else args[:1]
+            )
+            for path in paths:
+                if isinstance(path, (str, bytes, os.PathLike)) and not _inside(
+                    path, writable
+                ):
+                    raise PermissionError(f"sandbox: {event} {path} is not allowed")
+
+    sys.addaudithook(hook)
+
+
+def _set_limits(cpu_seconds, memory_bytes):
+    # SIGXCPU at the soft CPU limit, SIGKILL one second later
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+    resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+
+
+def _patch_save(timings, saved=None):
+    # Presentation.save is timed on its own, the rest of the script is "run".
+    # With a saved list every presentation goes into memory instead of a file.
+    from pptx.presentation import Presentation
+
+    save = Presentation.save
+
+    def patched_save(self, file):
+        with timed(timings, "save"):
+            if saved is None:
+                return save(self, file)
+            buffer = io.BytesIO()
+            save(self, buffer)
+            saved.append(buffer.getvalue())
+            if not isinstance(file, (str, bytes, os.PathLike)):
+                file.write(saved[-1])
+
+    Presentation.save = patched_save
+
+
+# Runs a script read from stdin in a fresh interpreter (the fallback without a
+# fork server): its output goes to stderr, the saved presentation to stdout
+_STDIN_RUNNER = """
+import io, sys
+from pptx.presentation import Presentation
+saved = []
+save = Presentation.save
+def save_to_memory(self, file):
+    buffer = io.BytesIO()
+    save(self, buffer)
+    saved.append(buffer.getvalue())
+    if not isinstance(file, (str, bytes)) and hasattr(file, "write"):
+        file.write(saved[-1])
+Presentation.save = save_to_memory
+code = sys.stdin.read()
+stdout = sys.stdout.buffer
+sys.stdout = sys.stderr
+exec(compile(code, "script.py", "exec"), {"__name__": "__main__"})
+if saved:
+    stdout.write(saved[-1])
+"""
+
+
+def _run_job(script_file, cwd, conn, sandbox=None, launched=None, code=None):
+    """Runs inside a fresh fork of the warm server.
+
+    With code the script is run from memory instead of script_file, and the
+    last presentation it saves is sent back as bytes instead of written.
+    """
+    timings = {}
+    if launched is not None:
+        timings["startup"] = max(0.0, time.time() - launched)
+    saved = [] if code is not None else None
+    if cwd:
+        os.chdir(cwd)
+    _patch_save(timings, saved)
+    if sandbox:
+        _set_limits(sandbox["cpu_seconds"], sandbox["memory_bytes"])
+        sys.dont_write_bytecode = True
+        # The fork server inherited the parent's environment, keys included
+        environ = _clean_environ()
+        os.environ.clear()
+        os.environ.update(environ)
+        _restrict_filesystem(cwd)
+    output = io.StringIO()
+    returncode = 0
+    error = None
+    try:
+        with (
+            timed(timings, "run"),
+            contextlib.redirect_stdout(output),
+            contextlib.redirect_stderr(output),
+        ):
+            if code is None:
+                runpy.run_path(script_file, run_name="__main__")
+            else:
+                exec(compile(code, script_file, "exec"), {"__name__": "__main__"})
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            returncode = e.code if isinstance(e.code, int) else 1
+            error = EXCEPTION
+    except MemoryError:
+        returncode = 1
+        error = OOM
+        output.write("MemoryError: script exceeded the memory limit\n")
+    except BaseException:
+        returncode = 1
+        error = EXCEPTION
+        output.write(traceback.format_exc())
+    timings["run"] -= timings.get("save", 0.0)
+    data = saved[-1] if saved else None
+    conn.send((returncode, output.getvalue(), error, timings, data))
+    conn.close()
+
+
+# Name of job processes, recognized by _skip_main
+JOB_NAME = "opengamma-script"
+_skip_main_lock = threading.Lock()
+
+
+def _skip_main():
+    # Like spawn, the fork server re-imports the parent's __main__ in every
+    # job. For a benchmark that means datasets and pyarrow: slow to start and
+    # well over the address-space limit. Jobs only need this module, so the
+    # preparation data of JOB_NAME processes leaves __main__ out. Installed
+    # once; other processes and __main__ itself are left alone.
+    with _skip_main_lock:
+        prepare = spawn.get_preparation_data
+        if getattr(prepare, "skips_main", False):
+            return
+
+        def get_preparation_data(name):
+            data = prepare(name)
+            if name == JOB_NAME:
+                data.pop("init_main_from_name", None)
+                data.pop("init_main_from_path", None)
+            return data
+
+        get_preparation_data.skips_main = True
+        spawn.get_preparation_data = get_preparation_data
+
+
+def _clean_environ():
+    return {name: os.environ[name] for name in _ENVIRON_KEEP if name in os.environ}
+
+
+def _wait_slice(deadline):
+    # How long to block before checking for cancellation again
+    if deadline is None:
+        return CANCEL_POLL
+    return max(0.0, min(CANCEL_POLL, deadline - time.monotonic()))
+
+
+def _stopped(deadline, cancelled):
+    if cancelled is not None and cancelled.is_set():
+        return "script cancelled", KILLED
+    if deadline is not None and time.monotonic() >= deadline:
+        return None, TIMEOUT
+    return None
+
+
+def _preexec(sandbox):
+    # Limits for the subprocess fallback, applied in the child before exec
+    return lambda: _set_limits(sandbox["cpu_seconds"], sandbox["memory_bytes"])
+
+
+class ScriptPool:
+    """Executes generated python-pptx scripts without paying interpreter startup.
+
+    A fork server imports python-pptx once; every job is a fresh fork of it, so
+    scripts start warm but never see each other's state. At most max_workers
+    jobs run at the same time.
+    """
+
+    def __init__(
+        self,
+        max_workers=None,
+        sandbox=SANDBOX,
+        timeout=SCRIPT_TIMEOUT,
+        cpu_seconds=SCRIPT_CPU_SECONDS,
+        memory_bytes=SCRIPT_MEMORY_BYTES,
+    ):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.sandbox = (
+            {"cpu_seconds": cpu_seconds, "memory_bytes": memory_bytes}
+            if sandbox
+            else None
+        )
+        self.timeout = timeout if sandbox else None
+        self._slots = threading.BoundedSemaphore(self.max_workers)
+        self._context = None
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            self._context = multiprocessing.get_context("forkserver")
+            self._context.set_forkserver_preload(PRELOAD)
+            _skip_main()
+            forkserver.ensure_running()
+
+    def run(self, script_file, cwd=None, timeout=None, timings=None):
+        """Run a script, returns (returncode, output, error).
+
+        error is None on success, otherwise the failure type: TIMEOUT (wall
+        clock), CPU (CPU time limit), OOM (memory limit), EXCEPTION (the
+        script raised or exited non-zero) or KILLED (died from a signal).
+        timeout overrides the pool's wall-clock limit for this run. The
+        startup, run and save durations are added to the timings dict.
+        """
+        returncode, output, error, _ = self._execute(
+            script_file, cwd or os.getcwd(), None, timeout, timings
+        )
+        return returncode, output, error
+
+    def run_code(self, code, timeout=None, timings=None):
+        """Run a script from memory, returns (returncode, output, error, data).
+
+        Nothing touches the disk: the code is passed to the job over a pipe
+        and Presentation.save is redirected to a buffer, data holds the bytes
+        of the last saved presentation (None if there is none). Sandboxed
+        scripts cannot write files at all. Otherwise like run.
+        """
+        return self._execute("script.py", None, code, timeout, timings)
+
+    def _execute(self, script_file, cwd, code, timeout, timings, cancelled=None):
+        # cancelled is a threading.Event; once set, a run still waiting for a
+        # worker gives up and a running job is killed
+        if timings is None:
+            timings = {}
+        if timeout is None:
+            timeout = self.timeout
+        elif self.timeout is not None:
+            timeout = min(timeout, self.timeout)
+        # Waiting for a free worker counts against the timeout too
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with timed(timings, "startup"):
+            while not self._slots.acquire(timeout=_wait_slice(deadline)):
+                stopped = _stopped(deadline, cancelled)
+                if stopped:
+                    message, error = stopped
+                    return (
+                        1,
+                        message or f"no free worker within {timeout:.1f}s",
+                        error,
+                        None,
+                    )
+        try:
+            if self._context is None:
+                return self._run_subprocess(
+                    script_file, cwd, code, timeout, timings, deadline, cancelled
+                )
+
+            parent_conn, child_conn = self._context.Pipe(duplex=False)
+            process = self._context.Process(
+                target=_run_job,
+                name=JOB_NAME,
+                args=(script_file, cwd, child_conn, self.sandbox, time.time(), code),
+            )
+            process.start()
+            child_conn.close()
+            data = None
+            try:
+                while not parent_conn.poll(_wait_slice(deadline)):
+                    stopped = _stopped(deadline, cancelled)
+                    if stopped:
+                        process.kill()
+                        process.join()
+                        message, error = stopped
+                        return (
+                            1,
+                            message or f"script timed out after {timeout:.1f}s",
+                            error,
+                            None,
+                        )
+                returncode, output, error, job_timings, data = parent_conn.recv()
+                for phase, value in job_timings.items():
+                    timings[phase] = timings.get(phase, 0.0) + value
+            except EOFError:
+                # The job died without reporting back (e.g. killed by a signal)
+                returncode, output, error = 1, "", None
+            finally:
+                parent_conn.close()
+            process.join()
+            if process.exitcode:
+                returncode = returncode or 1
+                output += f"\nprocess exited with code {process.exitcode}"
+                if error is None:
+                    error = CPU if process.exitcode == -signal.SIGXCPU else KILLED
+            return returncode, output, error, data
+        finally:
+            self._slots.release()
+
+    def _run_subprocess(
+        self, script_file, cwd, code, timeout, timings, deadline, cancelled
+    ):
+        # Fallback without a fork server: a fresh interpreter per script, fed
+        # on stdin when the script runs from memory
+        if code is None:
+            args, stdin = [sys.executable, script_file], None
+        else:
+            args, stdin = [sys.executable, "-c", _STDIN_RUNNER], code.encode()
+        with timed(timings, "run"):
+            process = subprocess.Popen(
+                args,
+                stdin=subprocess.PIPE if stdin is not None else None,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                cwd=cwd,
+                preexec_fn=_preexec(self.sandbox) if self.sandbox else None,
+                env=_clean_environ() if self.sandbox else None,
+            )
+            while True:
+                try:
+                    stdout, stderr = process.communicate(
+                        stdin, timeout=_wait_slice(deadline)
+                    )
+                    break
+                except subprocess.TimeoutExpired:
+                    # Input is only sent once, communicate keeps the rest
+                    stdin = None
+                    stopped = _stopped(deadline, cancelled)
+                    if stopped:
+                        process.kill()
+                        process.communicate()
+                        message, error = stopped
+                        return (
+                            1,
+                            message or f"script timed out after {timeout:.1f}s",
+                            error,
+                            None,
+                        )
+        output = stderr.decode(errors="replace")
+        data = stdout if code is not None and stdout else None
+        if process.returncode == -signal.SIGXCPU:
+            return 1, output, CPU, None
+        if "MemoryError" in output:
+            return 1, output, OOM, None
+        error = EXCEPTION if process.returncode else None
+        return process.returncode, output, error, data
+
+    async def _arun(self, script_file, cwd, code, timeout, timings):
+        # The worker thread cannot be interrupted, so cancelling the awaiting
+        # task tells it to kill the job and free its worker
+        cancelled = threading.Event()
+        try:
+            return await asyncio.to_thread(
+                self._execute, script_file, cwd, code, timeout, timings, cancelled
+            )
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    async def arun(self, script_file, cwd=None, timeout=None, timings=None):
+        """run for asyncio; cancelling the call kills the script."""
+        returncode, output, error, _ = await self._arun(
+            script_file, cwd or os.getcwd(), None, timeout, timings
+        )
+        return returncode, output, error
+
+    async def arun_code(self, code, timeout=None, timings=None):
+        """run_code for asyncio; cancelling the call kills the script."""
+        return await self._arun("script.py", None, code, timeout, timings)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Shared pool, started on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ScriptPool(
+                int(os.getenv("OPENGAMMA_EXECUTOR_WORKERS", "0")) or None
+            )
+    return _pool
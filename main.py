@@ -159,7 +159,16 @@ p.level = 2
 prs.save('test.pptx')"""
 
 if __name__ == "__main__":
-    result, _ = invoke_func(model, system_prompt, task, "1")
+    result, _, _ = invoke_func(
+        model,
+        system_prompt,
+        task,
+        "1",
+        output_file="test.pptx",
+        stream=True,
+        in_memory=True,
+        fast_path=True,
+    )
     if result == 1:
         print("Success")
     else:
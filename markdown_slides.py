@@ -0,0 +1,173 @@
+import argparse
+import re
+from collections import Counter
+
+# "### Слайд 3", "## Slide 3: Title", "**Слайд 3 – Title**"
+SLIDE_RE = re.compile(
+    r"^(?:#{1,4}\s*(?:\*\*)?|\*\*)\s*(?:слайд|slide)\s*(\d+)\s*(?:\*\*)?\s*[:.\-–—]?\s*(.*?)\s*(?:\*\*)?$",
+    re.IGNORECASE,
+)
+RULE_RE = re.compile(r"^\s*(-{3,}|\*{3,}|_{3,})\s*$")
+ITEM_RE = re.compile(r"^(\s*)([-*+•]|\d+[.)])\s+(.*)$")
+BOLD_LINE_RE = re.compile(r"^(?:#{1,6}\s*)?\*\*(.+?)\*\*\s*:?\s*$")
+HEADING_RE = re.compile(r"^#{1,6}\s+(.*)$")
+TABLE_SEPARATOR_RE = re.compile(r"^\|?\s*:?-{2,}:?\s*(\|\s*:?-{2,}:?\s*)*\|?$")
+
+MAX_LEVEL = 4
+
+
+def strip_inline(text):
+    """Plain text of a markdown line: emphasis, code and links removed."""
+    text = re.sub(r"\[([^\]]*)\]\([^)]*\)", r"\1", text)
+    text = re.sub(r"(\*\*|__)(.+?)\1", r"\2", text)
+    text = re.sub(r"(?<![\w*])\*(?!\s)(.+?)(?<!\s)\*(?![\w*])", r"\1", text)
+    text = re.sub(r"`([^`]*)`", r"\1", text)
+    return text.strip()
+
+
+def _cells(line):
+    line = line.strip()
+    if line.startswith("|"):
+        line = line[1:]
+    if line.endswith("|"):
+        line = line[:-1]
+    return [strip_inline(cell) for cell in line.split("|")]
+
+
+def _parse_slide(heading, lines):
+    title = strip_inline(heading)
+    bullets = []
+    table = None
+    indents = []
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        stripped = line.strip()
+        i += 1
+        if not stripped:
+            continue
+        if stripped.startswith("|"):
+            rows = [stripped]
+            while i < len(lines) and lines[i].strip().startswith("|"):
+                rows.append(lines[i].strip())
+                i += 1
+            if table is not None:
+                raise ValueError("more than one table")
+            if len(rows) < 2 or not TABLE_SEPARATOR_RE.match(rows[1]):
+                raise ValueError("table without a header separator")
+            header = _cells(rows[0])
+            body = [_cells(row) for row in rows[2:]]
+            if any(len(row) != len(header) for row in body):
+                raise ValueError("ragged table")
+            table = {"header": header, "rows": body}
+            continue
+        if stripped.startswith("!["):
+            raise ValueError("image")
+        if stripped.startswith("```"):
+            raise ValueError("code block")
+        if not title:
+            match = BOLD_LINE_RE.match(stripped) or HEADING_RE.match(stripped)
+            if match:
+                title = strip_inline(match.group(1))
+                continue
+        item = ITEM_RE.match(line)
+        if item:
+            # Nesting follows indentation, whatever its width
+            indent = len(item.group(1).expandtabs(4))
+            while indents and indents[-1] > indent:
+                indents.pop()
+            if not indents or indents[-1] < indent:
+                indents.append(indent)
+            text = strip_inline(item.group(3))
+            if item.group(2)[0].isdigit():
+                text = f"{item.group(2)[:-1]}. {text}"
+            bullets.append({"text": text, "level": min(len(indents) - 1, MAX_LEVEL)})
+            continue
+        match = HEADING_RE.match(stripped)
+        text = strip_inline(match.group(1) if match else stripped)
+        if text:
+            indents = []
+            bullets.append({"text": text, "level": 0})
+    if not title:
+        raise ValueError("slide without a title")
+    if not bullets and table is None:
+        raise ValueError("empty slide")
+    return {"title": title, "bullets": bullets, "table": table, "notes": ""}
+
+
+def parse_markdown(text):
+    """Slide spec (see slide_spec) of a task already written as slides.
+
+    The task has to consist of "### Слайд N" sections numbered from 1, each
+    with a title (on the heading line or as the first bold line) and bullets,
+    paragraphs or one pipe table. A horizontal rule ends a slide; text before
+    the first and after the last slide is ignored. Raises ValueError with the
+    reason when the task is not well-formed, so it has to go to the model.
+    """
+    _, sections = split_slides(text)
+    if not sections:
+        raise ValueError("no slide sections")
+    headings = []
+    for section in sections:
+        heading, _, body = section.partition("\n")
+        match = SLIDE_RE.match(heading.strip())
+        headings.append((int(match.group(1)), match.group(2), body.splitlines()))
+    if [number for number, _, _ in headings] != list(range(1, len(sections) + 1)):
+        raise ValueError("slides are not numbered in order")
+    slides = [_parse_slide(heading, lines) for _, heading, lines in headings]
+    return {"title": "", "subtitle": "", "slides": slides}
+
+
+def split_slides(text):
+    """Split a task on its "### Слайд N" headings, returns (intro, sections).
+
+    intro is the text before the first slide and every section the markdown
+    of one slide, heading included, up to the next slide or horizontal rule.
+    """
+    intro = []
+    sections = []
+    current = None
+    for line in text.splitlines():
+        if SLIDE_RE.match(line.strip()):
+            current = [line]
+            sections.append(current)
+        elif current is not None:
+            if RULE_RE.match(line):
+                current = None
+            else:
+                current.append(line)
+        elif not sections:
+            intro.append(line)
+    return "\n".join(intro).strip(), ["\n".join(lines).strip() for lines in sections]
+
+
+def main():
+    # Share of dataset tasks the LLM-free path can render:
+    # uv run markdown_slides.py mikeoxmaul/opengamma-prs-dedup
+    from snapshot import load_tasks
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("repo", nargs="?", default="mikeoxmaul/opengamma-prs-dedup")
+    parser.add_argument("--revision", help="snapshot revision, latest by default")
+    parser.add_argument("--limit", type=int, help="only check the first N tasks")
+    args = parser.parse_args()
+
+    tasks = load_tasks(args.repo, args.revision)
+    if args.limit:
+        tasks = tasks.select(range(min(args.limit, len(tasks))))
+    reasons = Counter()
+    qualifying = 0
+    for text in tasks["text"]:
+        try:
+            parse_markdown(text)
+            qualifying += 1
+        except ValueError as e:
+            reasons[str(e)] += 1
+    total = len(tasks)
+    print(f"{qualifying}/{total} tasks ({qualifying / max(total, 1):.1%}) qualify")
+    for reason, count in reasons.most_common():
+        print(f"  {reason}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import contextlib
+import math
+import time
+
+# Phases of one invoke_func call, in the order they happen
+PHASES = [
+    "queue",  # waiting for a per-model request slot
+    "connect",  # opening a new connection (0 when a pooled one is reused)
+    "ttfb",  # request sent until the response headers arrive
+    "ttft",  # request sent until the first token (streaming only)
+    "generation",  # request sent until the completion is fully read
+    "cleanup",  # stripping code fences
+    "write",  # writing the script into the workspace
+    "startup",  # waiting for a worker and forking it until the script begins
+    "run",  # running the script, without saving the pptx
+    "save",  # Presentation.save
+    "total",  # the whole call
+]
+
+
+@contextlib.contextmanager
+def timed(timings, phase):
+    """Add the duration of the block to timings[phase], in seconds."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[phase] = timings.get(phase, 0.0) + time.perf_counter() - start
+
+
+class LatencyHistogram:
+    """Streaming latency distribution with log-spaced buckets.
+
+    Buckets cover 0.1 ms to ~28 h with 20 buckets per decade, so a percentile
+    is within ~6% of the exact value; min, max and mean are exact.
+    """
+
+    def __init__(self, lo=1e-4, per_decade=20, decades=9):
+        self.lo = lo
+        self.per_decade = per_decade
+        self.counts = [0] * (per_decade * decades + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _bucket(self, value):
+        if value <= self.lo:
+            return 0
+        b = int(math.log10(value / self.lo) * self.per_decade) + 1
+        return min(b, len(self.counts) - 1)
+
+    def _upper(self, b):
+        return self.lo * 10 ** (b / self.per_decade)
+
+    def add(self, value):
+        self.counts[self._bucket(value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def percentile(self, q):
+        # Geometric middle of the bucket that holds the rank, clamped to [min, max]
+        rank = q / 100 * self.count
+        cumulative = 0
+        for b, count in enumerate(self.counts):
+            cumulative += count
+            if count and cumulative >= rank:
+                value = math.sqrt(self._upper(b - 1) * self._upper(b)) if b else self.lo
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def summary(self):
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean": self.total / self.count,
+            "min": self.min,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+def summarize(timings):
+    """Per-phase latency summaries of many timings dicts (see PHASES)."""
+    histograms = {}
+    for item in timings:
+        for phase, value in item.items():
+            histograms.setdefault(phase, LatencyHistogram()).add(value)
+    return {
+        phase: histograms[phase].summary()
+        for phase in sorted(
+            histograms, key=lambda p: PHASES.index(p) if p in PHASES else len(PHASES)
+        )
+    }
+
+
+def record_task(results, res):
+    """Add one benchmark task to the running totals of results.
+
+    res is a harness result with "time", "tokens" and the "info" returned by
+    invoke_func; results holds the counters every benchmark keeps
+    (total_tasks, total_time, token_usage, ttfts, timings, aborted_count,
+    wasted_tokens, error_types, timeout_stages). Success is left to the caller.
+    """
+    info = res["info"]
+    results["total_tasks"] += 1
+    results["total_time"] += res["time"]
+    for key in results["token_usage"]:
+        results["token_usage"][key] += res["tokens"][key]
+    if info.get("ttft") is not None:
+        results["ttfts"].append(info["ttft"])
+    if info.get("timings"):
+        results["timings"].append(info["timings"])
+    if info.get("aborted"):
+        results["aborted_count"] += 1
+    results["wasted_tokens"] += info.get("wasted_tokens", 0)
+    for field, counts in (
+        ("error_type", "error_types"),
+        ("timeout_stage", "timeout_stages"),
+    ):
+        if info.get(field):
+            results[counts][info[field]] = results[counts].get(info[field], 0) + 1
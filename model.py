@@ -1,93 +1,987 @@
-import requests
+import aiohttp
+import asyncio
+import atexit
+import codeop
+import contextlib
 import json
-import subprocess
 import sys
 import re
+import shutil
+import tempfile
+import threading
+import warnings
 from dotenv import load_dotenv
+from cache import cache_key, get_cache
+from executor import get_pool
+from markdown_slides import parse_markdown, split_slides
+from metrics import timed
+from slide_spec import SYSTEM_PROMPT as SPEC_SYSTEM_PROMPT, parse_spec, render_spec
 import os
 import logging
 import time
 
 log = logging.getLogger(__name__)
 
+load_dotenv()
 
-def invoke_func(model, system_prompt, task, id):
-    script_file = f".script_{id}.py"
-    pptx_file = f"test_{id}.pptx"
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
 
-    load_dotenv()
-    key = os.getenv("OPENROUTER_KEY")
+# How many generations of a single model may be in flight at once
+MAX_IN_FLIGHT_PER_MODEL = int(os.getenv("OPENGAMMA_MAX_IN_FLIGHT", "16"))
+# Size of the shared keep-alive connection pool
+MAX_CONNECTIONS = int(os.getenv("OPENGAMMA_MAX_CONNECTIONS", "64"))
 
+# Per-task workspaces live on tmpfs when it is available
+WORKSPACE_ROOT = os.getenv("OPENGAMMA_WORKSPACE_DIR") or (
+    "/dev/shm" if os.access("/dev/shm", os.W_OK) else None
+)
+SCRIPT_FILE = "script.py"
+PPTX_FILE = "test.pptx"
+# Tail of a failed script's output kept in info["stderr"]
+STDERR_LIMIT = 4000
+
+# Code every per-slide script starts with, shared by all slides of a deck
+SLIDE_PREAMBLE = """from pptx import Presentation
+from pptx.util import Inches, Pt
+from pptx.dml.color import RGBColor
+from pptx.enum.text import PP_ALIGN
+from pptx.chart.data import CategoryChartData
+from pptx.enum.chart import XL_CHART_TYPE
+
+prs = Presentation()
+"""
+SLIDE_SYSTEM_PROMPT = f"""
+Write the python-pptx code for ONE slide of a larger presentation.
+Your code is appended to this preamble, which has already run:
+
+{SLIDE_PREAMBLE}
+Add exactly one slide for the user's slide description to `prs`, e.g. with
+prs.slides.add_slide(prs.slide_layouts[1]). Do not create a new presentation
+and do not save it.
+Output ONLY the Python code as plain text, without markdown, code block markers (e.g., ```python)
+"""
+# Lines of a slide's code that would throw away or save the shared presentation
+SLIDE_FORBIDDEN_RE = re.compile(
+    r"^\s*(prs\s*=\s*Presentation\(.*|prs\.save\(.*)$", re.MULTILINE
+)
+
+# Temperatures of speculative candidates in turn; None keeps the model's
+# default, so the first candidate shares its cache entry with a normal run
+CANDIDATE_TEMPERATURES = [None, 0.7, 1.0]
+
+# Cumulative share of a deadline by which each stage has to be over; time
+# one stage does not use is left to the stages after it
+DEADLINE_STAGES = {"connect": 0.1, "ttft": 0.35, "generation": 0.8, "execution": 1.0}
+
+# Sessions and semaphores are bound to an event loop, so keep one set per loop
+_sessions = {}
+_semaphores = {}
+
+# Background loop that serves the synchronous invoke_func wrapper
+_loop = None
+_loop_lock = threading.Lock()
+
+
+async def _on_connection_create_start(session, context, params):
+    if context.trace_request_ctx is not None:
+        context.connect_start = time.perf_counter()
+
+
+async def _on_connection_create_end(session, context, params):
+    # Only new connections are timed; _complete records 0 for a reused one
+    if context.trace_request_ctx is not None:
+        context.trace_request_ctx["connect"] = (
+            time.perf_counter() - context.connect_start
+        )
+
+
+async def _get_session():
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(limit=MAX_CONNECTIONS, keepalive_timeout=60)
+        # Connection times go into the timings dict passed as trace_request_ctx
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_start.append(_on_connection_create_start)
+        trace_config.on_connection_create_end.append(_on_connection_create_end)
+        session = aiohttp.ClientSession(
+            connector=connector,
+            trace_configs=[trace_config],
+            headers={"Authorization": f"Bearer {os.getenv('OPENROUTER_KEY')}"},
+            # requests.post had no timeout either; generations can be slow
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=30),
+        )
+        _sessions[loop] = session
+    return session
+
+
+def _get_semaphore(model):
+    key = (asyncio.get_running_loop(), model)
+    if key not in _semaphores:
+        _semaphores[key] = asyncio.Semaphore(MAX_IN_FLIGHT_PER_MODEL)
+    return _semaphores[key]
+
+
+async def aclose():
+    """Close the HTTP session bound to the running event loop."""
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
+
+
+def _get_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_loop.run_forever, name="opengamma-llm", daemon=True
+            ).start()
+            atexit.register(_shutdown_loop)
+    return _loop
+
+
+def _shutdown_loop():
+    try:
+        asyncio.run_coroutine_threadsafe(aclose(), _loop).result(timeout=5)
+    finally:
+        _loop.call_soon_threadsafe(_loop.stop)
+
+
+class Deadline:
+    """One latency budget for a whole request, split across its stages."""
+
+    def __init__(self, seconds, stages=DEADLINE_STAGES):
+        self.seconds = seconds
+        self.stages = stages
+        # Same clock as the event loop, so at() works with asyncio.timeout_at
+        self.start = time.monotonic()
+
+    def at(self, stage):
+        """Monotonic time by which stage has to be over."""
+        return self.start + self.seconds * self.stages[stage]
+
+    def remaining(self, stage):
+        return max(0.0, self.at(stage) - time.monotonic())
+
+    def left(self):
+        """Seconds left of the whole budget."""
+        return max(0.0, self.start + self.seconds - time.monotonic())
+
+
+# Output that cannot turn into a python-pptx script once it starts this way
+REFUSAL_RE = re.compile(
+    r"^(i'?m sorry|i am sorry|sorry|i can'?not|i can't|i'?m unable|as an ai"
+    r"|извините|к сожалению|я не могу)",
+    re.IGNORECASE,
+)
+
+
+def _compiles(line):
+    # True for a complete statement and for the start of a longer one
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            codeop.compile_command(line, symbol="exec")
+    except (SyntaxError, ValueError, OverflowError):
+        return False
+    return True
+
+
+def invalid_prefix(text):
+    """Why a partial completion can no longer be valid code.
+
+    Returns None while the output still looks like code (or it is too early to
+    tell) and a short reason otherwise. Only the first line is checked, and
+    anything Python can compile (or could, given more lines) passes; a
+    leading code fence is tolerated since it is stripped before execution.
+    """
+    text = text.lstrip()
+    if text.startswith("```"):
+        if "\n" not in text:
+            return None
+        text = text.split("\n", 1)[1].lstrip()
+    if REFUSAL_RE.match(text):
+        return "refusal"
+    if "\n" not in text:
+        return None
+    if _compiles(text.split("\n", 1)[0]):
+        return None
+    return "prose"
+
+
+def invalid_spec_prefix(text):
+    """Why a partial completion can no longer be a JSON slide spec, like invalid_prefix."""
+    text = text.lstrip()
+    if text.startswith("```"):
+        if "\n" not in text:
+            return None
+        text = text.split("\n", 1)[1].lstrip()
+    if not text or text.startswith("{"):
+        return None
+    if REFUSAL_RE.match(text):
+        return "refusal"
+    return "prose"
+
+
+async def _read_stream(
+    response, info, sent, on_first_token=None, prefix_check=invalid_prefix
+):
+    """Collect SSE chunks, stops early once prefix_check rejects the output.
+
+    info["ttft"] is measured from sent, the perf_counter() time the request
+    went out.
+    """
+    content = ""
+    usage = None
+    async for raw_line in response.content:
+        line = raw_line.decode().strip()
+        if not line.startswith("data:"):
+            continue
+        data = line[len("data:") :].strip()
+        if data == "[DONE]":
+            break
+        chunk = json.loads(data)
+        if "error" in chunk:
+            raise ValueError(f"Stream error: {chunk['error']}")
+        if chunk.get("usage"):
+            usage = chunk["usage"]
+        for choice in chunk.get("choices", []):
+            delta = (choice.get("delta") or {}).get("content") or ""
+            if delta and info["ttft"] is None:
+                info["ttft"] = time.perf_counter() - sent
+                if on_first_token:
+                    on_first_token()
+            content += delta
+
+        reason = prefix_check(content)
+        if reason is not None:
+            info["aborted"] = reason
+            break
+    return content, usage
+
+
+async def _complete(model, payload, info, deadline=None, prefix_check=invalid_prefix):
+    """Send one chat completion request, returns (content, usage).
+
+    With a deadline every stage is cut off at its share of the budget:
+    waiting for a slot and connecting, then the time to first token (stream
+    only) and the generation. The request is cancelled, info["timeout_stage"]
+    names the stage and TimeoutError is raised.
+
+    Phase durations (queue, connect, ttfb, ttft, generation) are added to
+    info["timings"].
+    """
+    timings = info.setdefault("timings", {})
+    session = await _get_session()
+    stage = None
+    try:
+        async with asyncio.timeout(None) as scope:
+
+            def enter(name):
+                nonlocal stage
+                stage = name
+                if deadline:
+                    scope.reschedule(deadline.at(name))
+
+            enter("connect")
+            queued = time.perf_counter()
+            async with _get_semaphore(model):
+                timings["queue"] = time.perf_counter() - queued
+                options = {}
+                if deadline:
+                    # Connecting is bounded by aiohttp, the rest by the scope
+                    options["timeout"] = aiohttp.ClientTimeout(
+                        total=None,
+                        sock_connect=30,
+                        connect=deadline.remaining("connect"),
+                    )
+                enter("ttft" if payload["stream"] else "generation")
+                with timed(timings, "generation"):
+                    # Overwritten by the trace if a new connection is opened
+                    timings["connect"] = 0.0
+                    sent = time.perf_counter()
+                    async with session.post(
+                        OPENROUTER_URL,
+                        json=payload,
+                        trace_request_ctx=timings,
+                        **options,
+                    ) as response:
+                        timings["ttfb"] = time.perf_counter() - sent
+                        response.raise_for_status()
+                        if payload["stream"]:
+                            # Leaving the block early closes the connection and with it the generation
+                            content, usage = await _read_stream(
+                                response,
+                                info,
+                                sent,
+                                lambda: enter("generation"),
+                                prefix_check,
+                            )
+                            if info["ttft"] is not None:
+                                timings["ttft"] = info["ttft"]
+                            return content, usage
+                        result = await response.json()
+                        return (
+                            result["choices"][0]["message"]["content"],
+                            result.get("usage"),
+                        )
+    except aiohttp.ConnectionTimeoutError:
+        info["timeout_stage"] = "connect"
+        raise
+    except TimeoutError:
+        if scope.expired():
+            info["timeout_stage"] = stage
+        raise
+
+
+async def agenerate(
+    model,
+    system_prompt,
+    task,
+    stream=False,
+    sampling=None,
+    use_cache=False,
+    refresh_cache=False,
+    deadline=None,
+    info=None,
+    prefix_check=invalid_prefix,
+):
+    """Ask the model for a script, returns (generated_code, token_stats, info).
+
+    info has the time to first token ("ttft", streaming only), the reason
+    the stream was cut short ("aborted"), if it was, and whether the answer
+    came from the generation cache ("cached"). The cache is opt-in: with
+    use_cache=True completions are looked up and stored whether or not their
+    script runs (benchmarks rely on that), refresh_cache=True skips the
+    lookup but stores the result.
+    A Deadline limits the request, see _complete. Pass info to have it
+    filled in place, so it is also up to date when an exception is raised.
+    prefix_check decides when a stream is aborted (invalid_prefix for code).
+    """
     token_stats = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    if info is None:
+        info = {}
+    info.update(ttft=None, aborted=None, cached=False, timeout_stage=None)
+    info.setdefault("timings", {})
+    sampling = sampling or {}
+
+    # Cache I/O runs in a thread to keep SQLite off the event loop
+    key = cache_key(model, system_prompt, task, sampling)
+    cached = None
+    if use_cache and not refresh_cache:
+        cached = await asyncio.to_thread(get_cache().get, key)
+    if cached is not None:
+        generated_code, usage = cached
+        info["cached"] = True
+        log.info("Generation served from cache")
+    else:
+        payload = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": task},
+            ],
+            "stream": stream,
+            **sampling,
+        }
+        if stream:
+            payload["stream_options"] = {"include_usage": True}
+
+        generated_code, usage = await _complete(
+            model, payload, info, deadline, prefix_check
+        )
+        if use_cache and not info["aborted"] and generated_code.strip():
+            await asyncio.to_thread(get_cache().put, key, model, generated_code, usage)
+
+    generated_code = generated_code.strip()
+
+    if usage:
+        token_stats = {
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+            "total_tokens": usage.get("total_tokens", 0),
+        }
+        log.info(
+            f"Tokens used: prompt {usage.get('prompt_tokens', 0)}, completion {usage.get('completion_tokens', 0)}, total {usage.get('total_tokens', 0)}"
+        )
+    if info["ttft"] is not None:
+        log.info(f"Time to first token {info['ttft']:.2f} seconds")
+
+    return generated_code, token_stats, info
+
+
+@contextlib.contextmanager
+def workspace(id):
+    """Private directory for one task, removed on exit."""
+    with tempfile.TemporaryDirectory(
+        prefix=f"opengamma_{id}_", dir=WORKSPACE_ROOT
+    ) as path:
+        yield path
 
-    url = "https://openrouter.ai/api/v1/chat/completions"
-    payload = {
-        "model": model,
-        "messages": [
-            {"role": "system", "content": system_prompt.replace("test.pptx", pptx_file)},
-            {"role": "user", "content": task},
-        ],
-        "stream": False,
-    }
-    headers = {
-        "Authorization": f"Bearer {key}",
-    }
 
+async def arun_script(workdir, timeout=None, timings=None):
+    """Run the workspace script in the sandboxed pool.
+
+    Returns (result, error_type, output): result is 1 if the script produced
+    the pptx file, error_type is one of the executor failure types or None.
+    timeout tightens the pool's wall-clock limit; execution phases are added
+    to timings.
+    """
+    try:
+        returncode, output, error = await get_pool().arun(
+            SCRIPT_FILE, cwd=workdir, timeout=timeout, timings=timings
+        )
+        if returncode == 0:
+            log.info("Presentation generated successfully as 'test.pptx'")
+            if os.path.exists(os.path.join(workdir, PPTX_FILE)):
+                return 1, None, output
+            else:
+                return 0, "no_output", output
+        else:
+            log.error(f"Error executing generated script ({error}):\n{output}")
+            return 0, error, output
+    except Exception as e:
+        log.error(f"Error running script: {e}")
+        return 0, "exception", str(e)
+
+
+async def arun_code(code, timeout=None, timings=None):
+    """Run a script from memory in the sandboxed pool, no workspace needed.
+
+    Returns (result, error_type, output, data) like arun_script, data being
+    the bytes of the presentation the script saved.
+    """
+    try:
+        returncode, output, error, data = await get_pool().arun_code(
+            code, timeout=timeout, timings=timings
+        )
+        if returncode == 0:
+            if data:
+                log.info("Presentation generated successfully in memory")
+                return 1, None, output, data
+            else:
+                return 0, "no_output", output, None
+        else:
+            log.error(f"Error executing generated script ({error}):\n{output}")
+            return 0, error, output, None
+    except Exception as e:
+        log.error(f"Error running script: {e}")
+        return 0, "exception", str(e), None
+
+
+async def arender_spec(text, timings=None):
+    """Render a JSON slide spec in-process, no script to execute.
+
+    Returns (result, error_type, output, data) like arun_code; error_type is
+    "invalid_spec" when the completion is not a usable spec.
+    """
+    with timed(timings if timings is not None else {}, "run"):
+        try:
+            spec = parse_spec(text)
+        except ValueError as e:
+            log.error(f"Invalid slide spec: {e}")
+            return 0, "invalid_spec", str(e), None
+        try:
+            data = await asyncio.to_thread(render_spec, spec)
+        except Exception as e:
+            log.error(f"Error rendering slide spec: {e}")
+            return 0, "exception", str(e), None
+    log.info(f"Presentation rendered from a spec of {len(spec['slides'])} slides")
+    return 1, None, "", data
+
+
+async def _agenerate_checked(model, system_prompt, task, info, **kwargs):
+    """agenerate with its failures typed in info["error_type"].
+
+    Returns (generated_code, token_stats); generated_code is None when the
+    request failed or timed out, the stream was aborted or nothing came back.
+    """
+    token_stats = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
     start_time = time.time()
     try:
-        response = requests.post(url, json=payload, headers=headers)
-        response.raise_for_status()
-        end_time = time.time()
-        result = response.json()
-        generated_code = result["choices"][0]["message"]["content"].strip()
+        generated_code, token_stats, _ = await agenerate(
+            model, system_prompt, task, info=info, **kwargs
+        )
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        if info["timeout_stage"]:
+            log.error(f"Deadline exceeded during {info['timeout_stage']}")
+            info["error_type"] = "timeout"
+        else:
+            log.error(f"Error connecting: {e}")
+            info["error_type"] = "connection"
+        return None, token_stats
+    except (ValueError, KeyError) as e:
+        log.error(f"Error: {e}")
+        info["error_type"] = "api"
+        return None, token_stats
+    end_time = time.time()
 
-        if not generated_code:
-            return 0, token_stats
+    if info["aborted"]:
+        log.error(
+            f"Generation aborted after {end_time - start_time:.2f} seconds: {info['aborted']}"
+        )
+        info["error_type"] = "aborted"
+        return None, token_stats
 
-        # Clean up any code block markers or unwanted markdown
-        generated_code = re.sub(r"```python\n|```", "", generated_code).strip()
+    if not generated_code:
+        info["error_type"] = "empty"
+        return None, token_stats
 
-        # log.info(f"Generated code {generated_code}")
-        log.info(f"Generation took {end_time - start_time:.2f} seconds")
-        if "usage" in result:
-            usage = result["usage"]
-            token_stats = {
-                "prompt_tokens": usage.get("prompt_tokens", 0),
-                "completion_tokens": usage.get("completion_tokens", 0),
-                "total_tokens": usage.get("total_tokens", 0),
-            }
-            log.info(
-                f"Tokens used: prompt {usage.get('prompt_tokens', 0)}, completion {usage.get('completion_tokens', 0)}, total {usage.get('total_tokens', 0)}"
+    log.info(f"Generation took {end_time - start_time:.2f} seconds")
+    return generated_code, token_stats
+
+
+def _deliver(data, info, in_memory, output_file):
+    # Hand over the pptx bytes of a successful in-memory run or render
+    if in_memory:
+        info["pptx"] = data
+    if data is not None and output_file:
+        with open(output_file, "wb") as f:
+            f.write(data)
+
+
+async def _aexecute(code, id, info, timeout=None, in_memory=False, output_file=None):
+    """Run a generated script and deliver its pptx, returns result (1 or 0).
+
+    The failure type and output tail go into info, like in ainvoke_func.
+    """
+    timings = info["timings"]
+    if in_memory:
+        result, info["error_type"], output, data = await arun_code(
+            code, timeout, timings
+        )
+        _deliver(data, info, in_memory, output_file)
+    else:
+        with workspace(id) as workdir:
+            with (
+                timed(timings, "write"),
+                open(os.path.join(workdir, SCRIPT_FILE), "w") as f,
+            ):
+                f.write(code)
+
+            result, info["error_type"], output = await arun_script(
+                workdir, timeout, timings
             )
+            if result == 1 and output_file:
+                shutil.move(os.path.join(workdir, PPTX_FILE), output_file)
+    if result != 1:
+        info["stderr"] = output[-STDERR_LIMIT:]
+    if info["error_type"] == "timeout":
+        info["timeout_stage"] = "execution"
+    return result
 
-        if os.path.exists(pptx_file):
-            os.remove(pptx_file)
 
-        with open(script_file, "w") as f:
-            f.write(generated_code)
-        try:
-            result = subprocess.run(
-                ["uv", "run", script_file], capture_output=True, text=True
+async def _agenerate_slide(
+    model, context, section, index, total, feedback, info, **kwargs
+):
+    """Generate and check the code of one slide, returns (code, token_stats).
+
+    The slide runs on its own after the preamble; code is None when that
+    fails, with the failure typed in info like in ainvoke_func.
+    """
+    task = f"{context}\n\nSlide {index + 1} of {total}:\n{section}".strip()
+    if feedback:
+        task += f"\n\nThe previous code for this slide failed with:\n{feedback}"
+    code, token_stats = await _agenerate_checked(
+        model, SLIDE_SYSTEM_PROMPT, task, info, **kwargs
+    )
+    if code is None:
+        return None, token_stats
+    code = re.sub(r"```python\n|```", "", code).strip()
+    code = SLIDE_FORBIDDEN_RE.sub("", code).strip()
+    deadline = kwargs.get("deadline")
+    result, info["error_type"], output, _ = await arun_code(
+        f"{SLIDE_PREAMBLE}\n{code}\nprs.save({PPTX_FILE!r})",
+        deadline.remaining("execution") if deadline else None,
+    )
+    if result != 1:
+        log.error(f"Slide {index + 1} failed ({info['error_type']})")
+        info["stderr"] = output[-STDERR_LIMIT:]
+        return None, token_stats
+    return code, token_stats
+
+
+async def _ainvoke_per_slide(
+    model,
+    sections,
+    context,
+    id,
+    info,
+    retries=1,
+    in_memory=False,
+    output_file=None,
+    **kwargs,
+):
+    """Generate the slides of a deck concurrently and run them as one script.
+
+    Every slide is generated and checked on its own against SLIDE_PREAMBLE;
+    slides that fail are generated again (up to retries times) with their
+    error, the others are kept. info["slides"] has the attempts and last
+    failure of every slide.
+    """
+    timings = info["timings"]
+    token_stats = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    codes = [None] * len(sections)
+    slides = [{"attempts": 0, "error_type": None} for _ in sections]
+    info["slides"] = slides
+    feedback = [None] * len(sections)
+
+    with timed(timings, "generation"):
+        for _ in range(retries + 1):
+            pending = [i for i, code in enumerate(codes) if code is None]
+            if not pending:
+                break
+            slide_infos = [{"error_type": None, "stderr": None} for _ in pending]
+            outcomes = await asyncio.gather(
+                *(
+                    _agenerate_slide(
+                        model,
+                        context,
+                        sections[i],
+                        i,
+                        len(sections),
+                        feedback[i],
+                        slide_info,
+                        **kwargs,
+                    )
+                    for i, slide_info in zip(pending, slide_infos)
+                )
             )
-            if result.returncode == 0:
-                log.info("Presentation generated successfully as 'test.pptx'")
-                if os.path.exists(pptx_file):
-                    return 1, token_stats
-                else:
-                    return 0, token_stats
-            else:
-                log.error(f"Error executing generated script:\n{result.stderr}")
-                os.remove(script_file)
-                return 0, token_stats
-        except Exception as e:
-            log.error(f"Error running script: {e}")
-            if os.path.exists(script_file):
-                os.remove(script_file)
-            return 0, token_stats
+            for i, slide_info, (code, stats) in zip(pending, slide_infos, outcomes):
+                for key in token_stats:
+                    token_stats[key] += stats.get(key, 0)
+                slides[i]["attempts"] += 1
+                slides[i]["error_type"] = slide_info["error_type"]
+                codes[i] = code
+                feedback[i] = slide_info["stderr"] or slide_info["error_type"]
+
+    failed = [i for i, code in enumerate(codes) if code is None]
+    if failed:
+        log.error(
+            f"Slides {[i + 1 for i in failed]} failed after {retries + 1} attempts"
+        )
+        info["error_type"] = slides[failed[0]]["error_type"]
+        info["stderr"] = feedback[failed[0]]
+        return 0, token_stats
+
+    script = "\n\n".join(
+        [SLIDE_PREAMBLE]
+        + [f"# Slide {i + 1}\n{code}" for i, code in enumerate(codes)]
+        + [f"prs.save({PPTX_FILE!r})"]
+    )
+    deadline = kwargs.get("deadline")
+    timeout = deadline.remaining("execution") if deadline else None
+    result = await _aexecute(script, id, info, timeout, in_memory, output_file)
+    return result, token_stats
+
+
+def _candidates(model, candidates):
+    # An int k means k candidates of model over CANDIDATE_TEMPERATURES; once
+    # those repeat a seed keeps the requests (and cache keys) apart
+    if isinstance(candidates, int):
+        candidates = [
+            {"temperature": CANDIDATE_TEMPERATURES[i % len(CANDIDATE_TEMPERATURES)]}
+            for i in range(candidates)
+        ]
+    specs = []
+    for i, candidate in enumerate(candidates):
+        sampling = {}
+        if candidate.get("temperature") is not None:
+            sampling["temperature"] = candidate["temperature"]
+        if i >= len(CANDIDATE_TEMPERATURES):
+            sampling["seed"] = i
+        specs.append({"model": candidate.get("model") or model, "sampling": sampling})
+    return specs
+
 
-    except requests.exceptions.RequestException as e:
-        log.error(f"Error connecting: {e}")
+async def _arun_candidate(model, system_prompt, task, info, spec_mode, **kwargs):
+    """Generate and run one speculative candidate in memory, returns (result, data).
+
+    Its token usage is stored in info["tokens"] as soon as the generation is
+    over, so it is known even if the candidate is cancelled while running.
+    """
+    code, info["tokens"] = await _agenerate_checked(
+        model,
+        SPEC_SYSTEM_PROMPT if spec_mode else system_prompt,
+        task,
+        info,
+        prefix_check=invalid_spec_prefix if spec_mode else invalid_prefix,
+        **kwargs,
+    )
+    if code is None:
+        return 0, None
+    if spec_mode:
+        result, info["error_type"], output, data = await arender_spec(
+            code, info["timings"]
+        )
+    else:
+        code = re.sub(r"```python\n|```", "", code).strip()
+        deadline = kwargs.get("deadline")
+        result, info["error_type"], output, data = await arun_code(
+            code,
+            deadline.remaining("execution") if deadline else None,
+            info["timings"],
+        )
+    if result != 1:
+        info["stderr"] = output[-STDERR_LIMIT:]
+    return result, data
+
+
+async def _ainvoke_speculative(
+    specs,
+    system_prompt,
+    task,
+    info,
+    spec_mode=False,
+    in_memory=False,
+    output_file=None,
+    **kwargs,
+):
+    """Race candidates, returns (result, token_stats) of the first that works.
+
+    Every candidate is executed as soon as its generation is over; once one
+    produces a pptx the others are cancelled, which kills their scripts
+    (see ScriptPool.arun_code). token_stats sums the usage of all
+    candidates, info["wasted_tokens"] the part spent on the ones that did not
+    win (candidates cancelled while generating report no usage).
+    """
+    infos = [
+        {
+            "error_type": None,
+            "stderr": None,
+            "timings": {},
+            "tokens": None,
+            "model": spec["model"],
+            "sampling": spec["sampling"],
+        }
+        for spec in specs
+    ]
+    tasks = {
+        asyncio.create_task(
+            _arun_candidate(
+                spec["model"],
+                system_prompt,
+                task,
+                candidate_info,
+                spec_mode,
+                sampling=spec["sampling"],
+                **kwargs,
+            )
+        ): candidate_info
+        for spec, candidate_info in zip(specs, infos)
+    }
+    winner = None
+    data = None
+    pending = set(tasks)
+    try:
+        while pending and winner is None:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for candidate in done:
+                try:
+                    result, candidate_data = candidate.result()
+                except Exception as e:
+                    log.error(f"Candidate failed: {e}")
+                    tasks[candidate]["error_type"] = "exception"
+                    continue
+                if result == 1 and winner is None:
+                    winner, data = tasks[candidate], candidate_data
+    finally:
+        for candidate in pending:
+            candidate.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    token_stats = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    info["wasted_tokens"] = 0
+    info["candidates"] = []
+    for candidate, candidate_info in tasks.items():
+        tokens = candidate_info["tokens"] or {}
+        for key in token_stats:
+            token_stats[key] += tokens.get(key, 0)
+        if candidate_info is winner:
+            state = "won"
+        elif candidate in pending:
+            state = "cancelled"
+        else:
+            state = "failed" if candidate_info["error_type"] else "lost"
+        if candidate_info is not winner:
+            info["wasted_tokens"] += tokens.get("total_tokens", 0)
+        info["candidates"].append(
+            {
+                "model": candidate_info["model"],
+                "sampling": candidate_info["sampling"],
+                "state": state,
+                "error_type": candidate_info["error_type"],
+                "tokens": tokens.get("total_tokens", 0),
+            }
+        )
+    log.info(
+        f"Speculation: {[c['state'] for c in info['candidates']]}, {info['wasted_tokens']} tokens wasted"
+    )
+
+    # The returned info describes the winner, or the first candidate if none won
+    chosen = winner or infos[0]
+    for key in ("ttft", "aborted", "cached", "timeout_stage", "error_type", "stderr"):
+        info[key] = chosen.get(key)
+    for phase, value in chosen["timings"].items():
+        info["timings"].setdefault(phase, value)
+    if winner is None:
         return 0, token_stats
+    _deliver(data, info, in_memory, output_file)
+    return 1, token_stats
+
+
+async def _ainvoke_fast_path(task, info, in_memory=False, output_file=None):
+    """Render a task already written as slides without the model.
+
+    Returns False when the task is not slide-structured (see
+    markdown_slides.parse_markdown) or fails to render.
+    """
+    timings = info["timings"]
+    try:
+        with timed(timings, "run"):
+            data = await asyncio.to_thread(render_spec, parse_markdown(task))
     except ValueError as e:
-        log.error(f"Error: {e}")
+        log.info(f"Task is not slide-structured ({e}), asking the model")
+    except Exception as e:
+        log.error(f"Error rendering structured task, asking the model: {e}")
+    else:
+        log.info("Presentation rendered from the structured task")
+        info.update(
+            fast_path=True, ttft=None, aborted=None, cached=False, timeout_stage=None
+        )
+        _deliver(data, info, in_memory, output_file)
+        return True
+    timings.pop("run", None)
+    return False
+
+
+async def _ainvoke_single(
+    model,
+    system_prompt,
+    task,
+    id,
+    info,
+    spec_mode=False,
+    in_memory=False,
+    output_file=None,
+    **kwargs,
+):
+    """One generation, run as a script or rendered, returns (result, token_stats)."""
+    generated_code, token_stats = await _agenerate_checked(
+        model,
+        SPEC_SYSTEM_PROMPT if spec_mode else system_prompt,
+        task,
+        info,
+        prefix_check=invalid_spec_prefix if spec_mode else invalid_prefix,
+        **kwargs,
+    )
+    if generated_code is None:
         return 0, token_stats
+
+    timings = info["timings"]
+    if spec_mode:
+        result, info["error_type"], output, data = await arender_spec(
+            generated_code, timings
+        )
+        if result != 1:
+            info["stderr"] = output[-STDERR_LIMIT:]
+        _deliver(data, info, in_memory, output_file)
+        return result, token_stats
+
+    # Clean up any code block markers or unwanted markdown
+    with timed(timings, "cleanup"):
+        generated_code = re.sub(r"```python\n|```", "", generated_code).strip()
+
+    deadline = kwargs.get("deadline")
+    timeout = deadline.remaining("execution") if deadline else None
+    result = await _aexecute(generated_code, id, info, timeout, in_memory, output_file)
+    return result, token_stats
+
+
+async def ainvoke_func(
+    model,
+    system_prompt,
+    task,
+    id,
+    output_file=None,
+    in_memory=False,
+    deadline=None,
+    output_mode="code",
+    fast_path=False,
+    per_slide=False,
+    slide_retries=1,
+    candidates=None,
+    **kwargs,
+):
+    """Generate and run a script for one task, returns (result, token_stats, info).
+
+    kwargs (stream, use_cache, refresh_cache) go to agenerate. The pptx is
+    written to output_file if given; with in_memory=True nothing touches the
+    disk and its bytes are in info["pptx"]. deadline is the latency budget of
+    the call in seconds, split by DEADLINE_STAGES. output_mode="spec" asks for
+    a JSON slide spec instead of code. fast_path, per_slide (with
+    slide_retries) and candidates select the paths of _ainvoke_fast_path,
+    _ainvoke_per_slide and _ainvoke_speculative; see the README for all of
+    them. Failures are typed in info["error_type"], with the script's output
+    tail in info["stderr"]; info["timings"] has the phases of metrics.PHASES.
+    """
+    if output_mode not in ("code", "spec"):
+        raise ValueError(f"Unknown output mode: {output_mode}")
+    spec_mode = output_mode == "spec"
+    token_stats = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    timings = {}
+    info = {"error_type": None, "stderr": None, "timings": timings, "fast_path": False}
+    with timed(timings, "total"):
+        if fast_path and await _ainvoke_fast_path(task, info, in_memory, output_file):
+            return 1, token_stats, info
+
+        kwargs.update(
+            in_memory=in_memory,
+            output_file=output_file,
+            deadline=Deadline(deadline) if deadline else None,
+        )
+        specs = None
+        if candidates and candidates != 1 and not per_slide:
+            specs = _candidates(model, candidates)
+        if specs:
+            log.info(f"Racing {len(specs)} candidates")
+            result, token_stats = await _ainvoke_speculative(
+                specs, system_prompt, task, info, spec_mode=spec_mode, **kwargs
+            )
+            return result, token_stats, info
+
+        if per_slide and not spec_mode:
+            context, sections = split_slides(task)
+            if len(sections) > 1:
+                log.info(f"Generating {len(sections)} slides concurrently")
+                info.update(ttft=None, aborted=None, cached=False, timeout_stage=None)
+                result, token_stats = await _ainvoke_per_slide(
+                    model,
+                    sections,
+                    context,
+                    id,
+                    info,
+                    retries=slide_retries,
+                    **kwargs,
+                )
+                return result, token_stats, info
+
+        result, token_stats = await _ainvoke_single(
+            model, system_prompt, task, id, info, spec_mode, **kwargs
+        )
+        return result, token_stats, info
+
+
+def invoke_func(model, system_prompt, task, id, **kwargs):
+    """Synchronous wrapper around ainvoke_func.
+
+    All callers share one background event loop, so generations started from
+    different threads reuse the same pooled connections and per-model limits.
+    """
+    future = asyncio.run_coroutine_threadsafe(
+        ainvoke_func(model, system_prompt, task, id, **kwargs), _get_loop()
+    )
+    return future.result()
@@ -1,34 +1,22 @@
 import os
-from datasets import load_dataset
-from functools import cache
-import requests
-from dotenv import load_dotenv
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from sklearn.linear_model import LogisticRegression
 import json
-load_dotenv()
-dataset = load_dataset("mikeoxmaul/opengamma-prs-dedup", streaming=True)
-tasks = list(dataset["train"].take(100))
+from embeddings import get_embeddings
+from router import Router
+from snapshot import load_tasks
+tasks = load_tasks("mikeoxmaul/opengamma-prs-dedup").select(range(100))
 
 max_iter = 10
 
-@cache
+# All tasks are embedded in a few batched requests; vectors are kept in the
+# shared on-disk store, so re-training does not hit the API
+task_embeddings = get_embeddings([task["text"] for task in tasks])
+
 def get_embedding(index):
-        text = tasks[index]["text"]
-        key = os.getenv("OPENROUTER_KEY")
-        response = requests.post(
-                "https://openrouter.ai/api/v1/embeddings",
-                headers={
-                        "Authorization": f"Bearer {key}",
-                        "Content-Type": "application/json",
-                },
-                json={
-                        "model": "sentence-transformers/paraphrase-minilm-l6-v2",
-                        "input": text,
-                }
-        )
-        data = response.json()
-        embedding = data["data"][0]["embedding"]
-        return embedding
+        return task_embeddings[index]
 
 original = [ 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 14, 15, 16, 18, 20, 23, 24, 25, 27, 28, 31, 33, 34, 35, 36, 37, 38, 39, 40, 43, 47, 49, 51, 52, 54, 55, 56, 57, 59, 61, 62, 63, 64, 66, 68, 73, 74, 77, 78, 79, 81, 82, 83, 84, 85, 86, 87, 88, 91, 92, 93, 94, 95, 98, 99 ]
 basic = [ 2, 8, 10, 12, 13, 16, 20, 29, 35, 36, 37, 40, 47, 51, 55, 57, 61, 66, 71, 72, 73, 74, 81, 83, 90, 92, 94, 96 ]
@@ -85,6 +73,8 @@ clf = LogisticRegression(max_iter=1000)
 clf.fit(X, y)
 with open('classifier_tensors.json', 'w') as f:
     json.dump({'weights': clf.coef_.tolist(), 'bias': clf.intercept_.tolist()}, f)
+# Binary copy loaded by the benchmarks, the JSON stays as a fallback
+Router(clf.coef_, clf.intercept_, clf.classes_).save('classifier_tensors.npz')
 
 
 class Model:
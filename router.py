@@ -0,0 +1,69 @@
+import json
+import logging
+import os
+import sys
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+ROUTER_PATH = "classifier_tensors.npz"
+ROUTER_JSON_PATH = "classifier_tensors.json"
+
+
+class Router:
+    """Prompt router: a multinomial logistic regression evaluated with NumPy.
+
+    Holds the coefficients of the scikit-learn classifier trained in
+    prompt_classifier/train.py, so routing needs no sklearn import.
+    """
+
+    def __init__(self, weights, bias, classes=None):
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.bias = np.asarray(bias, dtype=np.float64)
+        if classes is None:
+            classes = np.arange(len(self.bias))
+        self.classes = np.asarray(classes)
+
+    @classmethod
+    def load(cls, path=ROUTER_PATH, json_path=ROUTER_JSON_PATH):
+        """Load weights from the .npz file, falling back to the JSON export."""
+        if os.path.exists(path):
+            with np.load(path) as data:
+                return cls(data["weights"], data["bias"], data["classes"])
+        log.info(f"{path} not found, loading router weights from {json_path}")
+        return cls.from_json(json_path)
+
+    @classmethod
+    def from_json(cls, json_path=ROUTER_JSON_PATH):
+        with open(json_path, "r") as f:
+            data = json.load(f)
+        return cls(data["weights"], data["bias"], data.get("classes"))
+
+    def save(self, path=ROUTER_PATH):
+        np.savez(path, weights=self.weights, bias=self.bias, classes=self.classes)
+
+    def scores(self, X):
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        return X @ self.weights.T + self.bias
+
+    def route(self, X):
+        """Route a batch of embeddings, returns (classes, probabilities)."""
+        scores = self.scores(X)
+        scores -= scores.max(axis=1, keepdims=True)
+        probabilities = np.exp(scores)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+        return self.classes[np.argmax(scores, axis=1)], probabilities
+
+
+def main():
+    # Convert the JSON export to the binary format: uv run router.py [in.json] [out.npz]
+    json_path = sys.argv[1] if len(sys.argv) > 1 else ROUTER_JSON_PATH
+    path = sys.argv[2] if len(sys.argv) > 2 else ROUTER_PATH
+    router = Router.from_json(json_path)
+    router.save(path)
+    print(f"Saved {router.weights.shape} router to {path}")
+
+
+if __name__ == "__main__":
+    main()
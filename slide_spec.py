@@ -0,0 +1,178 @@
+import io
+import json
+import re
+
+from pptx import Presentation
+from pptx.util import Inches, Pt
+
+SYSTEM_PROMPT = """
+Describe a PowerPoint presentation for the user's request as a JSON slide spec.
+Output ONLY the JSON object, without markdown or code block markers.
+
+Schema:
+{
+  "title": "deck title (optional, adds a title slide)",
+  "subtitle": "optional subtitle of the title slide",
+  "slides": [
+    {
+      "title": "slide title",
+      "bullets": ["plain bullet", {"text": "nested bullet", "level": 1}],
+      "table": {"header": ["column", "..."], "rows": [["cell", "..."]]},
+      "notes": "speaker notes"
+    }
+  ]
+}
+
+Every slide needs a title; bullets, table and notes are optional. Levels go
+from 0 (top) to 4. Keep bullets short and write in the language of the request.
+"""
+
+MAX_LEVEL = 4
+BULLET_SIZE = Pt(18)
+TABLE_SIZE = Pt(12)
+
+# Layouts of the default template
+TITLE_LAYOUT = 0
+CONTENT_LAYOUT = 1
+TITLE_ONLY_LAYOUT = 5
+
+
+def _text(value, what):
+    if not isinstance(value, (str, int, float)):
+        raise ValueError(f"{what} must be a string")
+    return str(value).strip()
+
+
+def _bullet(item):
+    if isinstance(item, dict):
+        level = item.get("level", 0)
+        if not isinstance(level, int):
+            raise ValueError("bullet level must be an integer")
+        return {
+            "text": _text(item.get("text", ""), "bullet text"),
+            "level": min(max(level, 0), MAX_LEVEL),
+        }
+    return {"text": _text(item, "bullet"), "level": 0}
+
+
+def _table(table):
+    if not isinstance(table, dict):
+        raise ValueError("table must be an object")
+    header = [_text(cell, "table cell") for cell in table.get("header") or []]
+    rows = [
+        [_text(cell, "table cell") for cell in row]
+        for row in table.get("rows") or []
+        if isinstance(row, list)
+    ]
+    width = max([len(header)] + [len(row) for row in rows])
+    if not width:
+        return None
+    # Short rows are padded, so the table stays rectangular
+    return {
+        "header": header + [""] * (width - len(header)) if header else [],
+        "rows": [row + [""] * (width - len(row)) for row in rows],
+    }
+
+
+def parse_spec(text):
+    """Parse and normalize a slide spec from a completion.
+
+    Code fences around the JSON are tolerated. Raises ValueError when the
+    completion is not a usable spec.
+    """
+    text = re.sub(r"^```(json)?\s*|\s*```$", "", text.strip())
+    spec = json.loads(text)
+    if not isinstance(spec, dict) or not isinstance(spec.get("slides"), list):
+        raise ValueError("spec must be an object with a list of slides")
+    if not spec["slides"]:
+        raise ValueError("spec has no slides")
+    slides = []
+    for slide in spec["slides"]:
+        if not isinstance(slide, dict):
+            raise ValueError("slide must be an object")
+        bullets = slide.get("bullets") or []
+        if not isinstance(bullets, list):
+            bullets = [bullets]
+        slides.append(
+            {
+                "title": _text(slide.get("title", ""), "slide title"),
+                "bullets": [_bullet(item) for item in bullets],
+                "table": _table(slide["table"]) if slide.get("table") else None,
+                "notes": _text(slide.get("notes") or "", "notes"),
+            }
+        )
+    return {
+        "title": _text(spec.get("title") or "", "title"),
+        "subtitle": _text(spec.get("subtitle") or "", "subtitle"),
+        "slides": slides,
+    }
+
+
+def _fill_bullets(text_frame, bullets, size=None):
+    text_frame.word_wrap = True
+    for i, bullet in enumerate(bullets):
+        paragraph = text_frame.paragraphs[0] if i == 0 else text_frame.add_paragraph()
+        paragraph.text = bullet["text"]
+        paragraph.level = bullet["level"]
+        if size:
+            paragraph.font.size = size
+
+
+def _add_table(slide, table, top, prs):
+    rows = table["rows"]
+    header = table["header"]
+    n_rows = len(rows) + (1 if header else 0)
+    n_cols = len(header or rows[0])
+    left = Inches(0.5)
+    width = prs.slide_width - 2 * left
+    height = min(Inches(0.4) * n_rows, prs.slide_height - top - Inches(0.3))
+    shape = slide.shapes.add_table(n_rows, n_cols, left, top, width, height)
+    shape.table.first_row = bool(header)
+    for r, row in enumerate(([header] if header else []) + rows):
+        for c, value in enumerate(row):
+            cell = shape.table.cell(r, c)
+            cell.text = value
+            for paragraph in cell.text_frame.paragraphs:
+                paragraph.font.size = TABLE_SIZE
+
+
+def render_spec(spec):
+    """Render a parsed spec with python-pptx, returns the pptx bytes."""
+    prs = Presentation()
+    if spec["title"]:
+        slide = prs.slides.add_slide(prs.slide_layouts[TITLE_LAYOUT])
+        slide.shapes.title.text = spec["title"]
+        if spec["subtitle"]:
+            slide.placeholders[1].text = spec["subtitle"]
+        else:
+            slide.placeholders[1].element.getparent().remove(
+                slide.placeholders[1].element
+            )
+
+    for item in spec["slides"]:
+        if item["table"]:
+            # Bullets go into a text box above the table
+            slide = prs.slides.add_slide(prs.slide_layouts[TITLE_ONLY_LAYOUT])
+            top = Inches(1.6)
+            if item["bullets"]:
+                height = Inches(0.45) * min(len(item["bullets"]), 6)
+                box = slide.shapes.add_textbox(
+                    Inches(0.5), top, prs.slide_width - Inches(1), height
+                )
+                _fill_bullets(box.text_frame, item["bullets"], BULLET_SIZE)
+                top += height + Inches(0.2)
+            _add_table(slide, item["table"], top, prs)
+        else:
+            slide = prs.slides.add_slide(prs.slide_layouts[CONTENT_LAYOUT])
+            body = slide.placeholders[1]
+            if item["bullets"]:
+                _fill_bullets(body.text_frame, item["bullets"])
+            else:
+                body.element.getparent().remove(body.element)
+        slide.shapes.title.text = item["title"]
+        if item["notes"]:
+            slide.notes_slide.notes_text_frame.text = item["notes"]
+
+    buffer = io.BytesIO()
+    prs.save(buffer)
+    return buffer.getvalue()
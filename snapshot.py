@@ -0,0 +1,69 @@
+import argparse
+import logging
+import os
+import re
+from pathlib import Path
+
+from datasets import load_dataset, load_from_disk
+from huggingface_hub import HfApi
+
+log = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = os.getenv("OPENGAMMA_SNAPSHOT_DIR", ".cache/snapshots")
+
+
+def _repo_dir(repo):
+    return Path(SNAPSHOT_DIR) / re.sub(r"[^\w.-]", "_", repo)
+
+
+def create_snapshot(repo, revision=None, split="train"):
+    """Download one revision of a Hub dataset split into a local Arrow file.
+
+    The revision (a branch, tag or commit, latest by default) is resolved to a
+    commit sha, so the snapshot is pinned; it also becomes the default one
+    returned by load_tasks.
+    """
+    sha = HfApi().dataset_info(repo, revision=revision).sha
+    path = _repo_dir(repo) / sha / split
+    if not path.exists():
+        dataset = load_dataset(repo, revision=sha, split=split)
+        dataset.save_to_disk(str(path))
+    (_repo_dir(repo) / "LATEST").write_text(sha)
+    log.info(f"Snapshot of {repo}@{sha} ({split}) saved to {path}")
+    return path
+
+
+def load_tasks(repo, revision=None, split="train"):
+    """Tasks of a dataset split from its local snapshot.
+
+    The Arrow file is memory-mapped, so loading costs nothing and tasks[i] is
+    O(1). Without a revision the latest snapshot is used; when there is none
+    yet, one is created (the only time the network is used).
+    """
+    if revision is None:
+        latest = _repo_dir(repo) / "LATEST"
+        if latest.exists():
+            revision = latest.read_text().strip()
+    path = _repo_dir(repo) / str(revision) / split
+    if revision is None or not path.exists():
+        log.info(f"No local snapshot of {repo}, downloading it")
+        path = create_snapshot(repo, revision, split)
+    log.info(f"Loading tasks from {path}")
+    return load_from_disk(str(path))
+
+
+def main():
+    # Pin a dataset revision locally: uv run snapshot.py mikeoxmaul/opengamma-prs-dedup
+    parser = argparse.ArgumentParser()
+    parser.add_argument("repo", help="Hugging Face dataset repository")
+    parser.add_argument("--revision", help="branch, tag or commit, latest by default")
+    parser.add_argument("--split", default="train")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    path = create_snapshot(args.repo, args.revision, args.split)
+    print(f"Saved {len(load_from_disk(str(path)))} rows to {path}")
+
+
+if __name__ == "__main__":
+    main()
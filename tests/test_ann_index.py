@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from ann_index import ExactIndex, IVFIndex
+
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(300, 8)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def brute_force(kept, queries):
+    sims = queries @ kept.T
+    return sims.max(axis=1), sims.argmax(axis=1)
+
+
+def test_exact_index_grows_and_finds_the_best_match(vectors):
+    index = ExactIndex(8, capacity=4)
+    for i, vector in enumerate(vectors[:50]):
+        index.add(vector, 100 + i)
+    index.add_many(vectors[50:200], range(150, 300))
+    best, ids = index.search(vectors[200:])
+    expected, rows = brute_force(vectors[:200], vectors[200:])
+    np.testing.assert_allclose(best, expected, rtol=1e-6)
+    assert list(ids) == [100 + row for row in rows]
+    np.testing.assert_allclose(
+        index.similarities(vectors[0]), vectors[:200] @ vectors[0], rtol=1e-6
+    )
+
+
+def test_empty_index():
+    best, ids = ExactIndex(8).search(np.ones((2, 8), dtype=np.float32))
+    assert np.all(best == -np.inf) and np.all(ids == -1)
+
+
+def test_ivf_probing_every_list_is_exact(vectors):
+    index = IVFIndex(8, nlist=6, nprobe=6)
+    index.train(vectors)
+    index.add_many(vectors[:200], list(range(200)))
+    assert len(index) == 200
+    best, ids = index.search(vectors[200:])
+    expected, rows = brute_force(vectors[:200], vectors[200:])
+    np.testing.assert_allclose(best, expected, rtol=1e-6)
+    assert list(ids) == list(rows)
+
+
+def test_ivf_search_never_beats_exact(vectors):
+    index = IVFIndex(8, nlist=8, nprobe=2)
+    index.train(vectors)
+    index.add_many(vectors[:200], list(range(200)))
+    best, _ = index.search(vectors[200:])
+    exact, _ = index.search_exact(vectors[200:])
+    assert np.all(best <= exact + 1e-6)
+    # A kept vector is always found in its own list
+    found, ids = index.search(vectors[:20])
+    np.testing.assert_allclose(found, 1.0, rtol=1e-5)
+    assert list(ids) == list(range(20))
@@ -0,0 +1,67 @@
+import time
+
+import cache
+from cache import GenerationCache, cache_key
+
+
+def test_key_depends_on_every_part():
+    key = cache_key("m", "sys", "task", {"temperature": 0.7})
+    assert key == cache_key("m", "sys", "task", {"temperature": 0.7})
+    assert key != cache_key("m", "sys", "task")
+    assert key != cache_key("m", "sys", "other task", {"temperature": 0.7})
+
+
+def test_get_put(tmp_path):
+    store = GenerationCache(str(tmp_path / "g.sqlite"))
+    assert store.get("k") is None
+    store.put("k", "m", "print(1)", {"total_tokens": 3})
+    assert store.get("k") == ("print(1)", {"total_tokens": 3})
+    store.put("k", "m", "print(2)")
+    assert store.get("k") == ("print(2)", None)
+    stats = store.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (2, 1, 1)
+    assert stats["size_bytes"] == len("print(2)")
+
+
+def test_evicts_least_recently_used(tmp_path):
+    store = GenerationCache(str(tmp_path / "g.sqlite"), max_bytes=100)
+    for key in "abc":
+        store.put(key, "m", "x" * 30)
+        time.sleep(0.01)
+    # A hit makes "a" the most recently used one
+    store.get("a")
+    time.sleep(0.01)
+    store.put("d", "m", "x" * 30)
+    assert store.get("b") is None
+    assert all(store.get(key) for key in "acd")
+    assert store.stats()["evictions"] == 1
+    assert store.stats()["size_bytes"] == 90
+
+
+def test_touches_are_batched(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "TOUCH_BATCH", 3)
+    path = str(tmp_path / "g.sqlite")
+    store = GenerationCache(path)
+    for key in "abc":
+        store.put(key, "m", "x")
+
+    def accessed(key):
+        return store._conn.execute(
+            "SELECT accessed FROM generations WHERE key = ?", (key,)
+        ).fetchone()[0]
+
+    before = accessed("a")
+    store.get("a")
+    assert accessed("a") == before
+    store.flush()
+    assert accessed("a") > before
+    # The third touched key writes the batch
+    for key in "abc":
+        store.get(key)
+    assert not store._touched
+
+
+def test_size_survives_reopening(tmp_path):
+    path = str(tmp_path / "g.sqlite")
+    GenerationCache(path).put("k", "m", "x" * 10)
+    assert GenerationCache(path)._size == 10
@@ -0,0 +1,78 @@
+import time
+
+import pytest
+
+import cascade
+from cascade import cost, escalation_task, token_cost
+
+CHAIN = [
+    {"name": "small", "model": "small", "system_prompt": "p"},
+    {"name": "large", "model": "large", "system_prompt": "p"},
+]
+TOKENS = {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}
+
+
+@pytest.fixture
+def steps(monkeypatch):
+    # Outcomes of the steps in turn, as (result, error_type, seconds)
+    outcomes = []
+    calls = []
+
+    def invoke_func(model, system_prompt, task, id, **options):
+        calls.append({"model": model, "task": task, **options})
+        result, error_type, seconds = outcomes.pop(0)
+        time.sleep(seconds)
+        return result, dict(TOKENS), {"error_type": error_type, "stderr": "Boom"}
+
+    monkeypatch.setattr(cascade, "invoke_func", invoke_func)
+    return outcomes, calls
+
+
+def test_escalates_with_the_error(steps):
+    outcomes, calls = steps
+    outcomes += [(0, "exception", 0), (1, None, 0)]
+    result, tokens, info = cascade.cascade(CHAIN, "deck", 1)
+    assert result == 1 and info["step"] == 1
+    assert tokens["total_tokens"] == 30
+    assert [step["error_type"] for step in info["steps"]] == ["exception", None]
+    assert calls[1]["task"] == escalation_task("deck", "Boom")
+
+
+def test_stops_on_errors_not_worth_escalating(steps):
+    outcomes, calls = steps
+    outcomes += [(0, "connection", 0)]
+    result, _, info = cascade.cascade(CHAIN, "deck", 1)
+    assert result == 0 and info["step"] is None and len(calls) == 1
+
+
+def test_steps_share_the_deadline(steps):
+    outcomes, calls = steps
+    outcomes += [(0, "timeout", 0.3), (0, "timeout", 0)]
+    cascade.cascade(CHAIN, "deck", 1, deadline=10)
+    assert calls[0]["deadline"] <= 10
+    assert calls[1]["deadline"] <= calls[0]["deadline"] - 0.3
+
+
+def test_no_escalation_after_the_deadline(steps):
+    outcomes, calls = steps
+    outcomes += [(0, "timeout", 0.3)]
+    result, _, info = cascade.cascade(CHAIN, "deck", 1, deadline=0.2)
+    assert result == 0 and len(calls) == 1
+
+
+def test_costs():
+    steps = [{"model": "small", "tokens": TOKENS}, {"model": "large", "tokens": TOKENS}]
+    prices = {
+        "small": {"prompt": 1.0, "completion": 2.0},
+        "large": {"prompt": 10.0, "completion": 20.0},
+    }
+    assert cost(steps, prices) == pytest.approx((20 + 200) / 1_000_000)
+    assert cost(steps, {"small": prices["small"]}) is None
+    assert token_cost(steps) == 2 * (10 + 5 * cascade.COMPLETION_WEIGHT)
+
+
+def test_escalation_task_keeps_the_tail():
+    assert escalation_task("deck", None) == "deck"
+    task = escalation_task("deck", "x" * 5000 + "Error")
+    assert task.startswith("deck\n\n") and task.endswith("Error")
+    assert len(task) < 5000
@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+from sklearn.metrics.pairwise import cosine_similarity
+
+from deduplicate_dataset import DatasetDeduplicator, SimilarityHistogram
+
+
+def greedy_reference(embeddings, threshold):
+    # The original loop: compare every text with all texts kept before it
+    keep_indices = [0]
+    pairs = []
+    for i in range(1, len(embeddings)):
+        similarities = cosine_similarity(
+            embeddings[i].reshape(1, -1), embeddings[keep_indices]
+        )
+        if np.max(similarities) < threshold:
+            keep_indices.append(i)
+        else:
+            pairs.append((i, keep_indices[np.argmax(similarities)]))
+    return keep_indices, pairs
+
+
+@pytest.fixture
+def embeddings():
+    # Clusters of near-duplicates around a few directions, plus loners
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(8, 16))
+    rows = [
+        centers[rng.integers(8)] + rng.normal(scale=0.3, size=16) for _ in range(80)
+    ]
+    rows += list(rng.normal(size=(20, 16)))
+    return np.asarray(rows, dtype=np.float32)[rng.permutation(100)]
+
+
+@pytest.fixture
+def deduplicator():
+    # Without __init__, which loads the dataset and the embedding model
+    return DatasetDeduplicator.__new__(DatasetDeduplicator)
+
+
+@pytest.mark.parametrize("threshold", [0.8, 0.9, 0.95])
+@pytest.mark.parametrize("block_size", [1, 7, 1024])
+def test_matches_the_greedy_loop(embeddings, deduplicator, threshold, block_size):
+    texts = [f"text {i}" for i in range(len(embeddings))]
+    keep_indices, duplicates, _, _, _ = deduplicator.find_duplicates(
+        texts, embeddings, threshold=threshold, block_size=block_size
+    )
+    expected_keep, expected_pairs = greedy_reference(embeddings, threshold)
+    assert keep_indices == expected_keep
+    assert [(d["duplicate_index"], d["original_index"]) for d in duplicates] == (
+        expected_pairs
+    )
+
+
+def test_ivf_probing_every_list_matches_exact(embeddings, deduplicator):
+    texts = [f"text {i}" for i in range(len(embeddings))]
+    exact = deduplicator.find_duplicates(texts, embeddings, threshold=0.9)
+    ivf = deduplicator.find_duplicates(
+        texts, embeddings, threshold=0.9, index="ivf", nlist=4, nprobe=4
+    )
+    assert ivf[0] == exact[0]
+    assert ivf[4]["index"] == "ivf"
+
+
+def test_ids_map_rows_to_dataset_indices(embeddings, deduplicator):
+    texts = [f"text {i}" for i in range(len(embeddings))]
+    ids = range(1000, 1000 + len(embeddings))
+    keep_indices, duplicates, _, _, _ = deduplicator.find_duplicates(
+        texts, embeddings, threshold=0.9, ids=ids
+    )
+    expected_keep, expected_pairs = greedy_reference(embeddings, 0.9)
+    assert keep_indices == [1000 + i for i in expected_keep]
+    assert duplicates[0]["duplicate_index"] == 1000 + expected_pairs[0][0]
+
+
+def test_blockwise_stats_match_numpy(embeddings, deduplicator):
+    normalized = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    pairs = (normalized @ normalized.T)[np.triu_indices(len(normalized), k=1)]
+    # A budget of a few rows per block
+    stats = deduplicator.analyze_similarities(normalized, max_block_bytes=11 * 100 * 5)
+    width = 2.0 / SimilarityHistogram().bins
+    assert stats["min"] == pytest.approx(pairs.min())
+    assert stats["max"] == pytest.approx(pairs.max())
+    assert stats["mean"] == pytest.approx(pairs.mean(), abs=1e-6)
+    for q, key in [(5, "percentile_5"), (50, "median"), (95, "percentile_95")]:
+        assert abs(stats[key] - np.percentile(pairs, q)) <= width
+
+
+def test_histogram_with_few_values():
+    histogram = SimilarityHistogram()
+    histogram.add([0.2, 0.6, 0.9])
+    width = 2.0 / histogram.bins
+    assert abs(histogram.percentile(50) - 0.6) <= width
+    assert abs(histogram.percentile(25) - np.percentile([0.2, 0.6, 0.9], 25)) <= width
@@ -0,0 +1,97 @@
+import multiprocessing
+
+import numpy as np
+import pytest
+
+import embeddings
+from embeddings import EmbeddingStore, make_batches
+
+
+def test_add_get_and_reopen(tmp_path):
+    store = EmbeddingStore("org/model", tmp_path)
+    assert store.get("a") is None
+    store.add("a", [1, 2, 3])
+    store.add("b", np.array([4, 5, 6]))
+    store.add("a", [7, 8, 9])
+    np.testing.assert_array_equal(store.get("a"), [1, 2, 3])
+
+    reopened = EmbeddingStore("org/model", tmp_path)
+    assert len(reopened) == 2 and "b" in reopened
+    np.testing.assert_array_equal(reopened.get_many(["b", "a"]), [[4, 5, 6], [1, 2, 3]])
+    with pytest.raises(ValueError):
+        reopened.add("c", [1, 2])
+
+
+def test_sees_appends_of_another_store(tmp_path):
+    first = EmbeddingStore("m", tmp_path)
+    second = EmbeddingStore("m", tmp_path)
+    first.add("a", [1, 2])
+    second.add("b", [3, 4])
+    np.testing.assert_array_equal(first.get("b"), [3, 4])
+    np.testing.assert_array_equal(second.get("a"), [1, 2])
+
+
+def test_crashed_append_is_ignored_and_overwritten(tmp_path):
+    store = EmbeddingStore("m", tmp_path)
+    store.add("a", [1, 2])
+    # A vector written without its index line, then a half-written line
+    with open(store.matrix_path, "ab") as f:
+        f.write(np.array([9, 9], dtype=np.float32).tobytes())
+    with open(store.index_path, "ab") as f:
+        f.write(b"deadbeef")
+
+    reopened = EmbeddingStore("m", tmp_path)
+    assert len(reopened) == 1
+    reopened.add("b", [3, 4])
+    np.testing.assert_array_equal(
+        EmbeddingStore("m", tmp_path).get_many(["a", "b"]), [[1, 2], [3, 4]]
+    )
+
+
+def _append(directory, start):
+    store = EmbeddingStore("m", directory)
+    for i in range(start, start + 50):
+        store.add(f"text {i}", [i, -i])
+
+
+def test_concurrent_processes(tmp_path):
+    processes = [
+        multiprocessing.get_context("spawn").Process(
+            target=_append, args=(tmp_path, start)
+        )
+        for start in (0, 50, 100)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    store = EmbeddingStore("m", tmp_path)
+    assert len(store) == 150
+    for i in (0, 75, 149):
+        np.testing.assert_array_equal(store.get(f"text {i}"), [i, -i])
+
+
+def test_make_batches():
+    texts = ["a" * 10, "b" * 10, "c" * 10, "d"]
+    assert make_batches(texts, batch_size=2) == [texts[:2], texts[2:]]
+    assert make_batches(texts, batch_size=10, max_chars=15) == [
+        texts[:1],
+        texts[1:2],
+        texts[2:],
+    ]
+
+
+def test_get_embeddings_fetches_only_missing(tmp_path, monkeypatch):
+    store = EmbeddingStore("m", tmp_path)
+    store.add("known", [0.0, 1.0])
+    monkeypatch.setattr(embeddings, "_stores", {"m": store})
+    requested = []
+
+    def fetch(texts, model):
+        requested.append(list(texts))
+        return [[len(text), 0.0] for text in texts]
+
+    monkeypatch.setattr(embeddings, "fetch_embeddings", fetch)
+    matrix = embeddings.get_embeddings(["known", "abc", "abc", "de"], model="m")
+    assert requested == [["abc", "de"]]
+    np.testing.assert_array_equal(matrix, [[0, 1], [3, 0], [3, 0], [2, 0]])
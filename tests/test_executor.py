@@ -0,0 +1,97 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from executor import CPU, EXCEPTION, OOM, TIMEOUT, ScriptPool
+
+DECK = """from pptx import Presentation
+prs = Presentation()
+prs.slides.add_slide(prs.slide_layouts[0]).shapes.title.text = "x"
+prs.save("test.pptx")
+"""
+
+
+@pytest.fixture(scope="module")
+def pool():
+    # Set before the fork server starts, so jobs would inherit it
+    os.environ.setdefault("OPENROUTER_KEY", "secret")
+    return ScriptPool(2, timeout=5, cpu_seconds=1, memory_bytes=512 * 1024 * 1024)
+
+
+def test_run_code_returns_the_presentation(pool):
+    returncode, output, error, data = pool.run_code(DECK)
+    assert (returncode, error) == (0, None), output
+    assert data[:2] == b"PK"
+
+
+def test_run_writes_into_its_workdir(pool, tmp_path):
+    (tmp_path / "script.py").write_text(DECK)
+    returncode, output, error = pool.run("script.py", cwd=tmp_path)
+    assert (returncode, error) == (0, None), output
+    assert (tmp_path / "test.pptx").exists()
+
+
+def test_exception(pool):
+    returncode, output, error, _ = pool.run_code("raise ValueError('boom')")
+    assert (returncode, error) == (1, EXCEPTION)
+    assert "ValueError: boom" in output
+
+
+def test_timeout(pool):
+    start = time.monotonic()
+    returncode, _, error, _ = pool.run_code("import time\ntime.sleep(60)", timeout=1)
+    assert (returncode, error) == (1, TIMEOUT)
+    assert time.monotonic() - start < 3
+
+
+def test_cpu_limit(pool):
+    returncode, _, error, _ = pool.run_code("while True:\n    pass")
+    assert (returncode, error) == (1, CPU)
+
+
+def test_memory_limit(pool):
+    returncode, _, error, _ = pool.run_code("x = bytearray(2 * 1024**3)")
+    assert (returncode, error) == (1, OOM)
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        "import subprocess\nsubprocess.run(['true'])",
+        "import os\nos.system('true')",
+        "open('/tmp/opengamma-escaped.txt', 'w').write('x')",
+        "open('/etc/passwd').read()",
+        "import os\nos.listdir('/dev/shm')",
+        "import ctypes\nctypes.CDLL(None)",
+    ],
+)
+def test_sandbox_blocks(pool, code):
+    returncode, output, error, _ = pool.run_code(code)
+    assert (returncode, error) == (1, EXCEPTION)
+    assert "PermissionError: sandbox:" in output
+
+
+def test_sandbox_hides_the_environment(pool):
+    returncode, output, error, _ = pool.run_code(
+        "import os, sys\nprint('OPENROUTER_KEY' in os.environ, file=sys.stderr)"
+    )
+    assert (returncode, error) == (0, None)
+    assert output.strip() == "False"
+
+
+def test_cancel_kills_the_script(pool):
+    async def cancel():
+        task = asyncio.create_task(pool.arun_code("import time\ntime.sleep(60)"))
+        await asyncio.sleep(0.5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel())
+    # Both workers are free again
+    start = time.monotonic()
+    for _ in range(2):
+        assert pool.run_code("pass", timeout=2)[2] is None
+    assert time.monotonic() - start < 2
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from kept_store import KeptStore, append_delta, read_deltas
+
+
+def test_append_and_load(tmp_path):
+    store = KeptStore(tmp_path)
+    assert len(store) == 0 and store.load()[1] is None
+    embeddings = np.eye(3, dtype=np.float32)
+    store.append([4, 7], embeddings[:2], rows_seen=10, threshold=0.9)
+    store.append([12], embeddings[2:], rows_seen=15, threshold=0.9)
+
+    reopened = KeptStore(tmp_path)
+    ids, loaded = reopened.load()
+    assert list(ids) == [4, 7, 12]
+    np.testing.assert_array_equal(loaded, embeddings)
+    assert (reopened.rows_seen, reopened.threshold) == (15, 0.9)
+
+
+def test_empty_batch_only_moves_rows_seen(tmp_path):
+    store = KeptStore(tmp_path)
+    store.append([1], np.ones((1, 3)), rows_seen=5, threshold=0.8)
+    store.append([], np.empty((0, 0)), rows_seen=9, threshold=0.8)
+    reopened = KeptStore(tmp_path)
+    assert (len(reopened), reopened.rows_seen) == (1, 9)
+
+
+def test_rows_of_an_interrupted_append_are_dropped(tmp_path):
+    store = KeptStore(tmp_path)
+    store.append([1], np.ones((1, 3)), rows_seen=5, threshold=0.8)
+    # Files written, state not: the run stopped in between
+    with open(store.embeddings_path, "ab") as f:
+        f.write(np.ones(3, dtype=np.float32).tobytes())
+    with open(store.ids_path, "ab") as f:
+        f.write(np.array([2], dtype=np.int64).tobytes())
+
+    ids, embeddings = KeptStore(tmp_path).load()
+    assert list(ids) == [1] and embeddings.shape == (1, 3)
+
+
+def test_dimension_mismatch(tmp_path):
+    store = KeptStore(tmp_path)
+    store.append([1], np.ones((1, 3)), rows_seen=5, threshold=0.8)
+    with pytest.raises(ValueError):
+        store.append([2], np.ones((1, 4)), rows_seen=6, threshold=0.8)
+
+
+def test_deltas(tmp_path):
+    path = tmp_path / "delta.jsonl"
+    assert read_deltas(path) == []
+    append_delta({"rows": [0, 5]}, path)
+    append_delta({"rows": [5, 9]}, path)
+    assert [delta["rows"] for delta in read_deltas(path)] == [[0, 5], [5, 9]]
@@ -0,0 +1,61 @@
+import pytest
+
+from markdown_slides import parse_markdown, split_slides, strip_inline
+
+TASK = """Вот презентация:
+
+### Слайд 1: Введение
+- **Первый** пункт
+  - вложенный
+- второй
+
+### Слайд 2
+**Сравнение**
+| Вид | Особей |
+|-----|--------|
+| Барс | 70 |
+---
+Удачи!
+"""
+
+
+def test_parse():
+    spec = parse_markdown(TASK)
+    first, second = spec["slides"]
+    assert first["title"] == "Введение"
+    assert first["bullets"] == [
+        {"text": "Первый пункт", "level": 0},
+        {"text": "вложенный", "level": 1},
+        {"text": "второй", "level": 0},
+    ]
+    assert second["title"] == "Сравнение"
+    assert second["table"] == {"header": ["Вид", "Особей"], "rows": [["Барс", "70"]]}
+
+
+def test_split():
+    intro, sections = split_slides(TASK)
+    assert intro == "Вот презентация:"
+    assert len(sections) == 2
+    assert sections[1].endswith("| Барс | 70 |")
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "Просто текст без слайдов",
+        "### Слайд 2: Не с начала\n- пункт",
+        "### Слайд 1: Картинка\n![img](a.png)",
+        "### Слайд 1: Код\n```python\nx = 1\n```",
+        "### Слайд 1: Пусто\n",
+        "### Слайд 1: Таблица\n| a | b |\n| 1 | 2 |",
+    ],
+)
+def test_rejects(text):
+    with pytest.raises(ValueError):
+        parse_markdown(text)
+
+
+def test_strip_inline():
+    assert strip_inline("**жирный** и *курсив*, `код`, [ссылка](http://x)") == (
+        "жирный и курсив, код, ссылка"
+    )
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from metrics import LatencyHistogram, record_task, summarize, timed
+
+
+def test_timed_accumulates():
+    timings = {}
+    for _ in range(2):
+        with timed(timings, "run"):
+            pass
+    with pytest.raises(ValueError):
+        with timed(timings, "save"):
+            raise ValueError
+    assert set(timings) == {"run", "save"} and timings["run"] >= 0
+
+
+def test_percentiles_within_a_bucket():
+    values = np.random.default_rng(0).lognormal(mean=0, sigma=1.5, size=5000)
+    histogram = LatencyHistogram()
+    for value in values:
+        histogram.add(value)
+    summary = histogram.summary()
+    assert summary["count"] == 5000
+    assert summary["min"] == values.min() and summary["max"] == values.max()
+    assert summary["mean"] == pytest.approx(values.mean())
+    for q in (50, 90, 99):
+        assert summary[f"p{q}"] == pytest.approx(np.percentile(values, q), rel=0.07)
+
+
+def test_empty_summary():
+    assert LatencyHistogram().summary() == {"count": 0}
+
+
+def test_summarize_orders_phases():
+    summary = summarize([{"total": 2.0, "queue": 0.1}, {"run": 1.0, "total": 3.0}])
+    assert list(summary) == ["queue", "run", "total"]
+    assert summary["total"]["count"] == 2
+
+
+def test_record_task():
+    results = {
+        "total_tasks": 0,
+        "total_time": 0,
+        "token_usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        "ttfts": [],
+        "timings": [],
+        "aborted_count": 0,
+        "wasted_tokens": 0,
+        "error_types": {},
+        "timeout_stages": {},
+    }
+    tokens = {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}
+    info = {
+        "ttft": 0.3,
+        "timings": {"total": 1.0},
+        "error_type": "timeout",
+        "timeout_stage": "ttft",
+        "wasted_tokens": 7,
+    }
+    record_task(results, {"time": 1.0, "tokens": tokens, "info": info})
+    record_task(results, {"time": 2.0, "tokens": tokens, "info": {"aborted": "prose"}})
+    assert results["total_tasks"] == 2 and results["total_time"] == 3.0
+    assert results["token_usage"]["total_tokens"] == 30
+    assert results["ttfts"] == [0.3] and results["aborted_count"] == 1
+    assert results["wasted_tokens"] == 7
+    assert results["error_types"] == {"timeout": 1}
+    assert results["timeout_stages"] == {"ttft": 1}
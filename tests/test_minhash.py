@@ -0,0 +1,38 @@
+import numpy as np
+
+from minhash import MinHasher, lexical_deduplicate, shingle_hashes
+
+TEXT = (
+    "Презентация о редких животных Алтайского края: снежный барс, манул, "
+    "красный волк и их среда обитания, численность и меры охраны."
+)
+
+
+def test_exact_copies_after_normalization():
+    texts = [TEXT, "  " + TEXT.upper().replace(" ", "\n  "), "Совсем другой текст"]
+    keep, duplicates = lexical_deduplicate(texts)
+    assert keep == [0, 2]
+    assert duplicates == [
+        {"duplicate_index": 1, "original_index": 0, "similarity": 1.0, "stage": "exact"}
+    ]
+
+
+def test_near_copies_are_caught_by_minhash():
+    near = TEXT.replace("манул", "манулы")
+    keep, duplicates = lexical_deduplicate([TEXT, near, "Совсем другой текст"])
+    assert keep == [0, 2]
+    assert duplicates[0]["stage"] == "minhash"
+    assert duplicates[0]["original_index"] == 0
+
+
+def test_signature_estimates_jaccard():
+    a = shingle_hashes(TEXT.lower())
+    b = shingle_hashes(TEXT.lower()[: len(TEXT) // 2])
+    jaccard = len(np.intersect1d(a, b)) / len(np.union1d(a, b))
+    hasher = MinHasher(512)
+    estimate = np.mean(hasher.signature(a) == hasher.signature(b))
+    assert abs(estimate - jaccard) < 0.1
+
+
+def test_short_texts_have_a_shingle():
+    assert len(shingle_hashes("ab")) == 1
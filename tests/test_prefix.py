@@ -0,0 +1,59 @@
+import pytest
+
+from model import invalid_prefix, invalid_spec_prefix
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "from pptx import Presentation\n",
+        "import os\n",
+        "# Title slide\n",
+        'prs.slides[0].shapes.title.text = "x"\n',
+        "x: int = 3\n",
+        "a, b = 1, 2\n",
+        "prs = Presentation()  # new deck\n",
+        "def add_slide(prs):\n",
+        '"""Deck about\n',
+        "@dataclass\n",
+        "slide.shapes.add_table(\n",
+        "```python\nfrom pptx import Presentation\n",
+        "```python\n",
+        "Here is",
+        "",
+    ],
+)
+def test_code_or_undecided(text):
+    assert invalid_prefix(text) is None
+
+
+@pytest.mark.parametrize(
+    "text, reason",
+    [
+        ("Here is the code:\n", "prose"),
+        ("To create the presentation, we use python-pptx.\n", "prose"),
+        ("**Slide 1**\n", "prose"),
+        ("```python\nThe following script\n", "prose"),
+        ("I'm sorry, but", "refusal"),
+        ("К сожалению, я", "refusal"),
+    ],
+)
+def test_not_code(text, reason):
+    assert invalid_prefix(text) == reason
+
+
+@pytest.mark.parametrize("text", ["", "  {", '{"slides": [', "```json\n{", "```"])
+def test_spec_or_undecided(text):
+    assert invalid_spec_prefix(text) is None
+
+
+@pytest.mark.parametrize(
+    "text, reason",
+    [
+        ("Here is the spec", "prose"),
+        ("```json\nSure", "prose"),
+        ("Sorry, I can't", "refusal"),
+    ],
+)
+def test_not_spec(text, reason):
+    assert invalid_spec_prefix(text) == reason
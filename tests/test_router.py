@@ -0,0 +1,49 @@
+import json
+
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+
+from router import Router
+
+
+def fitted():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(120, 6))
+    y = np.argmax(X[:, :3], axis=1)
+    return X, LogisticRegression(max_iter=1000).fit(X, y)
+
+
+def test_matches_sklearn():
+    X, classifier = fitted()
+    router = Router(classifier.coef_, classifier.intercept_, classifier.classes_)
+    classes, probabilities = router.route(X)
+    np.testing.assert_array_equal(classes, classifier.predict(X))
+    np.testing.assert_allclose(probabilities, classifier.predict_proba(X), rtol=1e-6)
+
+
+def test_single_embedding():
+    X, classifier = fitted()
+    router = Router(classifier.coef_, classifier.intercept_)
+    classes, probabilities = router.route(X[0])
+    assert classes.shape == (1,) and probabilities.shape == (1, 3)
+
+
+def test_save_load_and_json_fallback(tmp_path):
+    X, classifier = fitted()
+    router = Router(classifier.coef_, classifier.intercept_, classifier.classes_)
+    path = tmp_path / "router.npz"
+    router.save(path)
+    loaded = Router.load(path)
+    np.testing.assert_array_equal(loaded.route(X)[0], router.route(X)[0])
+
+    json_path = tmp_path / "router.json"
+    json_path.write_text(
+        json.dumps(
+            {
+                "weights": classifier.coef_.tolist(),
+                "bias": classifier.intercept_.tolist(),
+            }
+        )
+    )
+    fallback = Router.load(tmp_path / "missing.npz", json_path)
+    np.testing.assert_array_equal(fallback.route(X)[0], router.route(X)[0])
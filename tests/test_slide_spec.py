@@ -0,0 +1,62 @@
+import io
+import json
+
+import pytest
+from pptx import Presentation
+
+from slide_spec import parse_spec, render_spec
+
+SPEC = {
+    "title": "Редкие животные",
+    "slides": [
+        {"title": "Барс", "bullets": ["Горы", {"text": "Алтай", "level": 9}]},
+        {
+            "title": "Численность",
+            "bullets": "одна строка",
+            "table": {"header": ["Вид", "Особей"], "rows": [["Манул"], ["Барс", 70]]},
+            "notes": "Данные за 2023 год",
+        },
+    ],
+}
+
+
+def test_parse_normalizes():
+    spec = parse_spec("```json\n" + json.dumps(SPEC, ensure_ascii=False) + "\n```")
+    first, second = spec["slides"]
+    assert first["bullets"] == [
+        {"text": "Горы", "level": 0},
+        {"text": "Алтай", "level": 4},
+    ]
+    assert second["bullets"] == [{"text": "одна строка", "level": 0}]
+    assert second["table"]["rows"] == [["Манул", ""], ["Барс", "70"]]
+    assert spec["subtitle"] == ""
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "not json",
+        "[]",
+        '{"slides": []}',
+        '{"slides": ["title"]}',
+        '{"slides": [{"title": {"text": "x"}}]}',
+        '{"slides": [{"title": "x", "table": "a, b"}]}',
+    ],
+)
+def test_parse_rejects(text):
+    with pytest.raises(ValueError):
+        parse_spec(text)
+
+
+def test_render():
+    data = render_spec(parse_spec(json.dumps(SPEC)))
+    prs = Presentation(io.BytesIO(data))
+    slides = list(prs.slides)
+    assert [slide.shapes.title.text for slide in slides] == [
+        "Редкие животные",
+        "Барс",
+        "Численность",
+    ]
+    table = next(shape for shape in slides[2].shapes if shape.has_table).table
+    assert table.cell(2, 1).text == "70"
+    assert slides[2].notes_slide.notes_text_frame.text == "Данные за 2023 год"
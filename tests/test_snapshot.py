@@ -0,0 +1,14 @@
+from datasets import Dataset
+
+import snapshot
+
+
+def test_load_tasks_reads_the_latest_snapshot(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot, "SNAPSHOT_DIR", str(tmp_path))
+    repo_dir = tmp_path / "org_tasks"
+    for sha, texts in [("old", ["a"]), ("new", ["b", "c"])]:
+        Dataset.from_dict({"text": texts}).save_to_disk(str(repo_dir / sha / "train"))
+    (repo_dir / "LATEST").write_text("new\n")
+
+    assert snapshot.load_tasks("org/tasks")["text"] == ["b", "c"]
+    assert snapshot.load_tasks("org/tasks", revision="old")["text"] == ["a"]